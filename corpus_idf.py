@@ -0,0 +1,252 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections import Counter
+import numpy as np
+from token_stream import DocumentTokens
+from utlis import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Longer tokens are almost always extraction debris and would widen the term array
+MAX_TERM_LENGTH = 40
+TERM_DTYPE = f'<U{MAX_TERM_LENGTH}'
+CURRENT_FILE = 'CURRENT'
+
+
+def analyze(text):
+    """Index terms of a text that has no DocumentTokens yet."""
+    return DocumentTokens(text).terms()
+
+
+def document_key(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def document_terms(terms):
+    """Sorted distinct terms of a document, as counted for its document frequency."""
+    return sorted({term for term in terms if len(term) <= MAX_TERM_LENGTH})
+
+
+def _version_path(directory, version):
+    return os.path.join(directory, f"v{version:06d}")
+
+
+def _list_versions(directory):
+    versions = []
+    for name in os.listdir(directory):
+        if name.startswith('v') and name[1:].isdigit():
+            versions.append(int(name[1:]))
+    return sorted(versions)
+
+
+def read_current_version(directory):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), 'r', encoding='utf-8') as file:
+            return int(file.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def pinned_version():
+    """Version pinned with CORPUS_IDF_VERSION, or None."""
+    version = os.environ.get("CORPUS_IDF_VERSION")
+    return int(version) if version else None
+
+
+class CorpusIDF:
+    """
+    Versioned document-frequency table of every document ingested so far.
+
+    A version is a directory holding the sorted term array and the matching document
+    frequencies as .npy files, which are memory-mapped so every worker process shares
+    the same pages, plus a JSON file with the document count and the keys of the
+    ingested documents. Versions are immutable: updates publish a new version and move
+    the CURRENT pointer, so a loaded table never changes under a running worker and a
+    version can be pinned (CORPUS_IDF_VERSION) to reproduce earlier scores.
+    """
+
+    def __init__(self, directory=None, version=None):
+        self.directory = directory or get_cache_dir("idf")
+        if version is None:
+            version = pinned_version() or read_current_version(self.directory)
+        self.version = int(version)
+        if self.version:
+            path = _version_path(self.directory, self.version)
+            if not os.path.isdir(path):
+                raise ValueError(
+                    f"Corpus IDF version {self.version} is not on disk in {self.directory}; "
+                    f"available versions: {_list_versions(self.directory)}"
+                )
+            self.terms = np.load(os.path.join(path, 'terms.npy'), mmap_mode='r')
+            self.df = np.load(os.path.join(path, 'df.npy'), mmap_mode='r')
+            with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            self.num_documents = meta['num_documents']
+            self.documents = set(meta['documents'])
+        else:
+            self.terms = np.array([], dtype=TERM_DTYPE)
+            self.df = np.array([], dtype=np.int64)
+            self.num_documents = 0
+            self.documents = set()
+
+    def idf(self, terms):
+        """
+        Smoothed inverse document frequencies, ln((1 + n) / (1 + df)) + 1, of a list of
+        terms; terms never seen in the corpus get df = 0.
+        """
+        terms = np.asarray(terms, dtype=TERM_DTYPE)
+        df = np.zeros(len(terms))
+        if len(self.terms) and len(terms):
+            positions = np.minimum(np.searchsorted(self.terms, terms), len(self.terms) - 1)
+            found = self.terms[positions] == terms
+            df[found] = self.df[positions[found]]
+        return np.log((1 + self.num_documents) / (1 + df)) + 1
+
+    def top_terms(self, terms, num_terms):
+        """
+        The `num_terms` terms of a document with the highest tf * idf, best first.
+
+        :param terms: Index terms of the document, e.g. DocumentTokens.terms()
+        """
+        counts = Counter(terms)
+        if not counts or num_terms <= 0:
+            return []
+        terms = list(counts)
+        scores = np.fromiter(counts.values(), dtype=float, count=len(terms)) * self.idf(terms)
+        if num_terms < len(terms):
+            top = np.argpartition(-scores, num_terms - 1)[:num_terms]
+        else:
+            top = np.arange(len(terms))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [terms[i] for i in top]
+
+    def publish_update(self, counts, keys, keep_versions=None):
+        """
+        Fold the document frequencies of new documents into the table and publish the
+        result as a new version.
+
+        The update always builds on the CURRENT version, not on the version this table
+        was loaded from, so a run pinned to an older version (CORPUS_IDF_VERSION) does
+        not drop the documents ingested since. Only the newest `keep_versions` versions
+        (CORPUS_IDF_KEEP_VERSIONS) are kept on disk, plus the pinned version and the one
+        this table was loaded from.
+
+        :param counts: Counter of the number of new documents containing each term, as
+                       accumulated by CorpusIDFUpdate
+        :param keys: Set of the new documents' keys (see document_key)
+        :return: The published version number, or the current one if `keys` is empty
+        """
+        if keep_versions is None:
+            keep_versions = int(os.environ.get("CORPUS_IDF_KEEP_VERSIONS", 5))
+        current_version = read_current_version(self.directory)
+        base = self if current_version == self.version else CorpusIDF(self.directory, current_version)
+        if not keys:
+            return base.version
+        repeated = keys & base.documents
+        if repeated:
+            logger.warning(f"{len(repeated)} documents were ingested by another run meanwhile; their terms are counted again")
+
+        new_terms = np.array(sorted(counts), dtype=TERM_DTYPE)
+        new_df = np.fromiter((counts[term] for term in new_terms), dtype=np.int64, count=len(new_terms))
+        terms = np.union1d(np.asarray(base.terms), new_terms).astype(TERM_DTYPE)
+        df = np.zeros(len(terms), dtype=np.int64)
+        if len(base.terms):
+            df[np.searchsorted(terms, base.terms)] += base.df
+        if len(new_terms):
+            df[np.searchsorted(terms, new_terms)] += new_df
+        meta = {
+            'num_documents': base.num_documents + len(keys),
+            'documents': sorted(base.documents | keys)
+        }
+
+        staging = tempfile.mkdtemp(dir=self.directory, prefix='.staging-')
+        try:
+            np.save(os.path.join(staging, 'terms.npy'), terms)
+            np.save(os.path.join(staging, 'df.npy'), df)
+            with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as file:
+                json.dump(meta, file)
+            version = max(_list_versions(self.directory) + [base.version]) + 1
+            while True:
+                try:
+                    # Fails if another process published this version number first
+                    os.rename(staging, _version_path(self.directory, version))
+                    break
+                except OSError:
+                    if not os.path.isdir(_version_path(self.directory, version)):
+                        raise
+                    version += 1
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(str(version))
+        os.replace(tmp_path, os.path.join(self.directory, CURRENT_FILE))
+        logger.info(f"Published corpus IDF version {version}: {meta['num_documents']} documents, {len(terms)} terms")
+
+        protected = {self.version, pinned_version()}
+        for old_version in _list_versions(self.directory)[:-keep_versions]:
+            if old_version in protected:
+                continue
+            shutil.rmtree(_version_path(self.directory, old_version), ignore_errors=True)
+        return version
+
+
+class CorpusIDFUpdate:
+    """
+    Document frequencies of newly processed documents, folded in one document at a time
+    and published as new CorpusIDF versions.
+
+    Only a Counter of the terms and the keys of the pending documents are kept, so
+    memory grows with the distinct new terms rather than with the number of documents.
+    Documents whose key was already ingested are skipped, so reprocessing a file does
+    not inflate its terms' frequencies and a batch with nothing new publishes nothing.
+    """
+
+    def __init__(self, corpus_idf=None):
+        """
+        :param corpus_idf: CorpusIDF the run scores against, protected from pruning;
+                           the current version when omitted
+        """
+        self.corpus_idf = corpus_idf or CorpusIDF()
+        current_version = read_current_version(self.corpus_idf.directory)
+        if current_version == self.corpus_idf.version:
+            self.ingested = set(self.corpus_idf.documents)
+        else:
+            self.ingested = set(CorpusIDF(self.corpus_idf.directory, current_version).documents)
+        self.counts = Counter()
+        self.keys = set()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, terms):
+        """
+        Fold in one document.
+
+        :param key: Document key, see document_key
+        :param terms: Distinct terms of the document, see document_terms
+        :return: False if the document was already ingested
+        """
+        if key in self.ingested or key in self.keys:
+            return False
+        self.keys.add(key)
+        self.counts.update(terms)
+        return True
+
+    def publish(self, keep_versions=None):
+        """
+        Publish the pending documents as a new version and start a new batch.
+
+        :return: The published version number, or the current one if nothing was pending
+        """
+        version = self.corpus_idf.publish_update(self.counts, self.keys, keep_versions)
+        self.ingested |= self.keys
+        self.counts = Counter()
+        self.keys = set()
+        return version
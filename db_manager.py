@@ -94,6 +94,21 @@ document_schema = {
     "last_updated": str
 }
 
+def to_storage_document(doc):
+    """
+    Convert a processed document into a BSON-encodable dictionary.
+
+    Pipeline records such as chunk views are stored through their `to_dict()` form.
+    """
+    def convert(value):
+        if hasattr(value, 'to_dict'):
+            return value.to_dict()
+        if isinstance(value, (list, tuple)):
+            return [convert(item) for item in value]
+        return value
+
+    return {key: convert(value) for key, value in doc.items()}
+
 def create_document_schema(db_manager):
     """Create a schema for the documents collection."""
     if db_manager.db is None:
@@ -0,0 +1,138 @@
+from collections import namedtuple
+from PyPDF2 import PdfReader
+
+# Pages are joined with this separator when the document text is assembled, so page
+# offsets and every chunk offset derived from them index into the same string.
+PAGE_SEPARATOR = "\n"
+
+Page = namedtuple('Page', ['page_number', 'offset', 'text'])
+
+
+class DocumentHandle:
+    """
+    Own a single parse of a PDF file so that every pipeline stage can share it.
+
+    The underlying ``PdfReader`` is created lazily on first use and the page count,
+    metadata and per-page text are cached, so extraction, chunking and summarization
+    of one document never parse the file more than once.
+
+    With ``cache_pages=False`` page text is not retained; consumers are expected to
+    stream it once through ``iter_pages``, which keeps memory flat in the page count.
+    """
+
+    def __init__(self, file_path, cache_pages=True):
+        self.path = file_path
+        self.cache_pages = cache_pages
+        self.page_offsets = []
+        self._reader = None
+        self._num_pages = None
+        self._metadata = None
+        self._page_texts = {}
+        self._content = None
+        self._content_offsets = None
+
+    @classmethod
+    def from_extraction(cls, file_path, num_pages, metadata, content, page_offsets):
+        """
+        Rebuild a handle from a previous extraction without touching PyPDF2.
+
+        :param content: Document text as returned by ``text()``
+        :param page_offsets: Offset of every page in ``content``
+        """
+        document = cls(file_path)
+        document._num_pages = num_pages
+        document._metadata = dict(metadata)
+        document._content = content
+        document._content_offsets = list(page_offsets)
+        document.page_offsets = list(page_offsets)
+        return document
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            self._reader = PdfReader(self.path)
+        return self._reader
+
+    @property
+    def is_encrypted(self):
+        if self._content is not None:
+            return False
+        return self.reader.is_encrypted
+
+    @property
+    def num_pages(self):
+        if self._num_pages is None:
+            self._num_pages = len(self.reader.pages)
+        return self._num_pages
+
+    @property
+    def metadata(self):
+        """Document information dictionary (empty if the PDF has none)."""
+        if self._metadata is None:
+            self._metadata = dict(self.reader.metadata or {})
+        return self._metadata
+
+    def page_text(self, page_number):
+        """
+        Return the extracted text of a single page.
+
+        :param page_number: Zero-based page index
+        :return: Extracted page text (empty string if the page has no text layer)
+        """
+        if page_number in self._page_texts:
+            return self._page_texts[page_number]
+        if self._content is not None:
+            offsets = self._content_offsets
+            end = offsets[page_number + 1] if page_number + 1 < len(offsets) else len(self._content)
+            return self._content[offsets[page_number]:end - len(PAGE_SEPARATOR)]
+        text = self.reader.pages[page_number].extract_text() or ""
+        if self.cache_pages:
+            self._page_texts[page_number] = text
+        return text
+
+    def iter_pages(self):
+        """
+        Yield the pages one at a time as ``Page(page_number, offset, text)``.
+
+        ``page_number`` is one-based and ``offset`` is the position of the page in the
+        document text, i.e. the pages joined with PAGE_SEPARATOR after each page. The
+        offsets of the pages yielded so far are kept in ``page_offsets``.
+        """
+        offset = 0
+        page_offsets = []
+        for page_number in range(self.num_pages):
+            text = self.page_text(page_number)
+            page_offsets.append(offset)
+            self.page_offsets = page_offsets
+            yield Page(page_number + 1, offset, text)
+            offset += len(text) + len(PAGE_SEPARATOR)
+
+    def text(self):
+        """Return the full document text with PAGE_SEPARATOR after every page."""
+        if self._content is not None:
+            return self._content
+        return "".join(page.text + PAGE_SEPARATOR for page in self.iter_pages())
+
+    def close(self):
+        """Drop the reader and cached text so the memory can be reclaimed."""
+        self._reader = None
+        self._page_texts = {}
+        self._content = None
+
+
+def as_document_handle(source):
+    """
+    Return ``source`` if it is already a DocumentHandle, otherwise open one for the path.
+
+    :param source: Path to a PDF file or an existing DocumentHandle
+    :return: DocumentHandle for the document
+    """
+    if isinstance(source, DocumentHandle):
+        return source
+    return DocumentHandle(source)
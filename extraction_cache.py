@@ -0,0 +1,103 @@
+import gzip
+import json
+import logging
+import os
+import tempfile
+from utlis import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever extraction or chunking changes shape so stale entries are ignored.
+EXTRACTION_CACHE_VERSION = 4
+
+
+class ExtractionCache:
+    """
+    Persistent on-disk cache of extraction results keyed by the PDF content hash.
+
+    Each entry stores the document text with its page offsets, the metadata used by
+    extract_pdf_info and the merged chunk list, as one gzip-compressed JSON file.
+    Reads refresh the file's modification time and writes evict the least recently
+    used entries once the directory grows past `max_bytes`. Writes go through a
+    temporary file and an atomic rename, so concurrent workers never see partial entries.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or get_cache_dir("extraction")
+        os.makedirs(self.directory, exist_ok=True)
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("EXTRACTION_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+        self.max_bytes = max_bytes
+
+    def _entry_path(self, content_hash):
+        return os.path.join(self.directory, f"{content_hash}.json.gz")
+
+    def get(self, content_hash):
+        """
+        Look up a cached extraction.
+
+        :param content_hash: SHA-256 of the PDF file content
+        :return: Cached entry dictionary, or None on a miss
+        """
+        path = self._entry_path(content_hash)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                entry = json.load(file)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable extraction cache entry {path}: {e}")
+            self._remove(path)
+            return None
+        if entry.get('version') != EXTRACTION_CACHE_VERSION:
+            return None
+        return entry
+
+    def put(self, content_hash, entry):
+        """
+        Store an extraction result and evict old entries if the cache is over budget.
+
+        :param content_hash: SHA-256 of the PDF file content
+        :param entry: JSON-serializable dictionary describing the extraction
+        """
+        entry = dict(entry, version=EXTRACTION_CACHE_VERSION)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as file:
+                json.dump(entry, file)
+            os.replace(tmp_path, self._entry_path(content_hash))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        total_bytes = 0
+        with os.scandir(self.directory) as it:
+            for dir_entry in it:
+                if not dir_entry.name.endswith('.json.gz'):
+                    continue
+                try:
+                    stat = dir_entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+                total_bytes += stat.st_size
+
+        if total_bytes <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            self._remove(path)
+            total_bytes -= size
+            if total_bytes <= self.max_bytes:
+                break
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,82 @@
+import os
+from collections import Counter, defaultdict
+from functools import lru_cache
+from itertools import islice
+import numpy as np
+from sklearn.utils import murmurhash3_32
+
+# With an IDF weight, this many times more buckets than requested are rescored
+CANDIDATE_FACTOR = 4
+# Streamed terms are hashed and counted this many at a time
+STREAM_BATCH_SIZE = 1 << 16
+
+
+class HashedTermCounter:
+    """
+    Count terms into a fixed-size array of hash buckets instead of a vocabulary.
+
+    Memory per document is the `n_features` count array (KEYWORD_HASH_FEATURES) no
+    matter how large its vocabulary is, and since the hash is seeded and stable, count
+    arrays of different processes or shards can simply be added together. Terms are
+    only mapped back from buckets for the top candidates, where the most frequent
+    term of a bucket stands for the bucket.
+    """
+
+    def __init__(self, n_features=None):
+        self.n_features = n_features or int(os.environ.get("KEYWORD_HASH_FEATURES", 1 << 20))
+        self.bucket = lru_cache(maxsize=65536)(self._bucket)
+
+    def _bucket(self, term):
+        return murmurhash3_32(term, seed=0, positive=True) % self.n_features
+
+    def top_streamed_terms(self, iter_terms, num_terms, weight=None):
+        """
+        The `num_terms` most frequent terms of a document, best first.
+
+        The terms are streamed twice, once to count them in batches of STREAM_BATCH_SIZE
+        and once to map the top buckets back to terms, so memory stays at the count
+        array however long the document and large its vocabulary.
+
+        :param iter_terms: Function returning a new iterator over the document's terms
+        :param weight: Optional function returning a weight per term, such as
+                       CorpusIDF.idf; applied to the top candidate buckets only
+        """
+        if num_terms <= 0:
+            return []
+        counts = np.zeros(self.n_features)
+        terms = iter_terms()
+        while True:
+            batch = np.fromiter((self.bucket(term) for term in islice(terms, STREAM_BATCH_SIZE)), dtype=np.int64)
+            if not len(batch):
+                break
+            counts += np.bincount(batch, minlength=self.n_features)
+        return self._rank_candidates(
+            counts, num_terms, weight, lambda: ((term, self.bucket(term), 1) for term in iter_terms())
+        )
+
+    def _rank_candidates(self, counts, num_terms, weight, iter_occurrences):
+        """
+        Rank the top buckets of `counts`, named after their most frequent term.
+
+        :param iter_occurrences: Function returning an iterator of (term, bucket, count)
+        """
+        num_candidates = num_terms * CANDIDATE_FACTOR if weight is not None else num_terms
+        num_candidates = min(num_candidates, int(np.count_nonzero(counts)))
+        if num_candidates == 0:
+            return []
+        candidates = np.argpartition(-counts, num_candidates - 1)[:num_candidates]
+        candidates = candidates[np.argsort(-counts[candidates], kind='stable')]
+
+        # Reverse map for the candidate buckets only
+        candidate_set = set(candidates.tolist())
+        bucket_terms = defaultdict(Counter)
+        for term, bucket, count in iter_occurrences():
+            if bucket in candidate_set:
+                bucket_terms[bucket][term] += count
+        names = [bucket_terms[bucket].most_common(1)[0][0] for bucket in candidates.tolist()]
+
+        scores = counts[candidates].astype(float)
+        if weight is not None:
+            scores *= weight(names)
+        order = np.argsort(-scores, kind='stable')[:num_terms]
+        return [names[i] for i in order]
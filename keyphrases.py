@@ -0,0 +1,142 @@
+import math
+from collections import Counter, namedtuple
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+# `count` is every occurrence of the phrase, `runs` the occurrences where it stands alone
+# between delimiters rather than inside a longer run
+Keyphrase = namedtuple('Keyphrase', ['phrase', 'count', 'runs', 'score'])
+
+# Constant of reciprocal rank fusion; damps the weight of the very first ranks
+RRF_K = 60
+
+# Nouns in scikit-learn's stop word list that head common phrases ("operating system")
+PHRASE_NOUNS = frozenset({
+    'system', 'computer', 'interest', 'detail', 'amount', 'bill', 'fire', 'mill',
+    'part', 'name', 'side', 'top', 'bottom', 'front', 'back'
+})
+
+
+class KeyphraseExtractor:
+    """
+    RAKE-style keyphrase extraction over a DocumentTokens stream.
+
+    Runs of content words are delimited by stop words, punctuation, numbers, verb forms
+    (`is_verb`) and sentence boundaries, as in RAKE. Candidates are the whole runs of
+    two to `max_words` words, plus the n-grams of longer runs that occur in at least
+    two distinct runs, so fragments straddling a boundary, such as "kernel manages
+    virtual", or only seen inside one recurring run, such as "system kernel", are not
+    proposed. A candidate's count includes its occurrences inside longer runs. Single
+    words are left to the TF-IDF and frequency rankings. As in YAKE, a phrase scores
+    by how often it recurs and how frequent its words are:
+    ``count * sum(log(1 + word_frequency))``. Phrases containing, or contained in, a
+    better-scored phrase are dropped, so "operating system" and "operating system
+    kernel" are not both returned.
+    """
+
+    def __init__(self, stop_words=(), max_words=3, is_verb=None):
+        self.stop_words = (set(stop_words) | ENGLISH_STOP_WORDS) - PHRASE_NOUNS
+        self.max_words = max_words
+        self.is_verb = is_verb
+
+    def is_content_word(self, word):
+        if len(word) <= 1 or not word.isalpha() or word in self.stop_words:
+            return False
+        return self.is_verb is None or not self.is_verb(word)
+
+    def extract(self, tokens, num_phrases):
+        """
+        :param tokens: DocumentTokens of the document
+        :return: Up to `num_phrases` Keyphrase records, best first
+        """
+        run_counts = Counter()
+        word_frequency = Counter()
+
+        words = tokens.words
+        for index in range(tokens.num_sentences):
+            first_word, last_word = tokens.sentence_words(index)
+            run = []
+            for word in words[first_word:last_word]:
+                if self.is_content_word(word):
+                    run.append(word)
+                elif run:
+                    run_counts[tuple(run)] += 1
+                    run = []
+            if run:
+                run_counts[tuple(run)] += 1
+        for run, count in run_counts.items():
+            for word in run:
+                word_frequency[word] += count
+
+        max_words = self.max_words
+        phrase_counts = Counter()
+        # Number of distinct runs each n-gram occurs in
+        contexts = Counter()
+        for run, count in run_counts.items():
+            ngrams = set()
+            for n in range(2, min(max_words, len(run)) + 1):
+                for start in range(len(run) - n + 1):
+                    ngrams.add(run[start:start + n])
+            for phrase in ngrams:
+                # Counts each phrase once per run, even if it repeats within the run
+                phrase_counts[phrase] += count
+                contexts[phrase] += 1
+
+        scored = sorted(
+            (Keyphrase(" ".join(phrase), count, run_counts.get(phrase, 0),
+                       count * sum(math.log1p(word_frequency[word]) for word in phrase))
+             for phrase, count in phrase_counts.items()
+             if phrase in run_counts or contexts[phrase] >= 2),
+            key=lambda keyphrase: keyphrase.score, reverse=True
+        )
+        selected = []
+        for keyphrase in scored:
+            if len(selected) == num_phrases:
+                break
+            padded = f" {keyphrase.phrase} "
+            if any(padded in f" {other.phrase} " or f" {other.phrase} " in padded for other in selected):
+                continue
+            selected.append(keyphrase)
+        return selected
+
+
+def reciprocal_rank_fusion(rankings, limit, key=None, k=RRF_K, merge_phrases=False):
+    """
+    Fuse several ranked lists into one by reciprocal rank fusion.
+
+    Every item scores the sum of 1 / (k + rank) over the lists it appears in, so items
+    ranked well by several sources come first. Items with the same `key` are merged
+    and represented by the spelling of their best-ranked occurrence.
+
+    With `merge_phrases`, a multi-word phrase also takes over the scores of its single
+    words that were ranked on their own, and those words are dropped, so that
+    "virtual memory" is returned instead of "virtual" and "memory".
+
+    :param rankings: Iterable of ranked lists of strings, best first
+    :param limit: Number of fused items to return
+    :param key: Optional normalization function used to identify items
+    """
+    scores = Counter()
+    representatives = {}
+    best_ranks = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            item_key = key(item) if key is not None else item
+            scores[item_key] += 1.0 / (k + rank)
+            if rank < best_ranks.get(item_key, float('inf')):
+                best_ranks[item_key] = rank
+                representatives[item_key] = item
+
+    if merge_phrases:
+        absorbed = set()
+        for item_key, score in scores.most_common():
+            words = item_key.split()
+            if len(words) < 2:
+                continue
+            for word in words:
+                if word in scores and word not in absorbed:
+                    scores[item_key] += scores[word]
+                    absorbed.add(word)
+        for word in absorbed:
+            del scores[word]
+
+    return [representatives[item_key] for item_key, _ in scores.most_common(limit)]
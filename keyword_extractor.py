@@ -1,49 +1,118 @@
-import nltk
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
-from nltk.stem import WordNetLemmatizer
-from sklearn.feature_extraction.text import TfidfVectorizer
-from collections import Counter
-import string
-from groq import Groq
 import os
-from utlis import classify_document_length
+import string
+from corpus_idf import CorpusIDF, analyze
+from hashed_keywords import HashedTermCounter
+from keyphrases import KeyphraseExtractor, reciprocal_rank_fusion
+from lemmatizer import CachedLemmatizer, count_lemmas
+from token_stream import DocumentTokens
+from llm_client import LLMClient
+from utlis import classify_document_length, ensure_nltk_data
 
-nltk.download('punkt', quiet=True)
-nltk.download('stopwords', quiet=True)
-nltk.download('wordnet', quiet=True)
+# Standalone occurrences for a keyphrase to count towards skipping LLM refinement
+MIN_STANDALONE_RUNS = 2
+
+def format_keywords(keywords):
+    """Keywords as the comma-separated text stored in MongoDB, like the LLM refines them."""
+    return ', '.join(keywords)
 
 class KeywordExtractor:
-    def __init__(self):
+    def __init__(self, corpus_idf=None, scoring=None):
+        ensure_nltk_data()
         self.stop_words = set(stopwords.words('english'))
-        self.lemmatizer = WordNetLemmatizer()
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-
-    def preprocess_text(self, text):
-        tokens = word_tokenize(text.lower())
-        tokens = [token for token in tokens if token.isalpha()]
-        tokens = [self.lemmatizer.lemmatize(token) for token in tokens if token not in self.stop_words]
-        return tokens
-
-    def extract_tfidf_keywords(self, text, num_keywords):
-        tfidf_vectorizer = TfidfVectorizer(stop_words='english')
-        tfidf_matrix = tfidf_vectorizer.fit_transform([text])
-        feature_names = tfidf_vectorizer.get_feature_names_out()
-        tfidf_scores = tfidf_matrix.toarray()[0]
-        word_scores = {word: score for word, score in zip(feature_names, tfidf_scores)}
-        sorted_words = sorted(word_scores.items(), key=lambda x: x[1], reverse=True)
-        return [word for word, score in sorted_words[:num_keywords]]
-
-    def extract_frequency_keywords(self, text, num_keywords):
-        tokens = self.preprocess_text(text)
-        word_freq = Counter(tokens)
+        self.lemmatizer = CachedLemmatizer()
+        self.llm = LLMClient()
+        # IDF weights come from the corpus ingested so far, not from the document itself
+        self.corpus_idf = corpus_idf or CorpusIDF()
+        # 'vocabulary' counts exact terms, 'hashing' counts into a fixed-size hashed array
+        # (KEYWORD_SCORING)
+        self.scoring = scoring or os.environ.get("KEYWORD_SCORING", "vocabulary")
+        if self.scoring not in ('vocabulary', 'hashing'):
+            raise ValueError(f"Unknown keyword scoring mode: {self.scoring}")
+        self.hashed_counter = HashedTermCounter() if self.scoring == 'hashing' else None
+        self.keyphrase_extractor = KeyphraseExtractor(self.stop_words, is_verb=self.lemmatizer.is_verb_form)
+        # When to refine keywords with the LLM (KEYWORD_REFINEMENT): 'always', 'never', or
+        # 'auto' to skip it when the keyphrase engine found enough recurring phrases
+        self.refinement = os.environ.get("KEYWORD_REFINEMENT", "always")
+        if self.refinement not in ('always', 'auto', 'never'):
+            raise ValueError(f"Unknown keyword refinement mode: {self.refinement}")
+
+    def preprocess_text(self, text, tokens=None):
+        words = tokens.words if tokens is not None else word_tokenize(text.lower())
+        return list(self.iter_lemmas(words))
+
+    def iter_lemmas(self, words):
+        """Lemmas of the alphabetic words that are not stop words, in text order."""
+        lemmatize = self.lemmatizer.lemmatize
+        stop_words = self.stop_words
+        return (lemmatize(word) for word in words if word.isalpha() and word not in stop_words)
+
+    def lemma_counts(self, text, tokens=None):
+        """Counter of the lemmas preprocess_text would produce, lemmatizing each distinct word once."""
+        if tokens is not None:
+            return tokens.lemma_counts(self.stop_words, self.lemmatizer.lemmatize)
+        return count_lemmas(word_tokenize(text.lower()), self.stop_words, self.lemmatizer.lemmatize)
+
+    def extract_tfidf_keywords(self, text, num_keywords, tokens=None):
+        if self.hashed_counter is not None:
+            # Terms are streamed into the hashed counts, never into a per-document list
+            if tokens is None:
+                tokens = DocumentTokens(text)
+            return self.hashed_counter.top_streamed_terms(tokens.iter_terms, num_keywords, weight=self.corpus_idf.idf)
+        terms = tokens.terms() if tokens is not None else analyze(text)
+        return self.corpus_idf.top_terms(terms, num_keywords)
+
+    def extract_frequency_keywords(self, text, num_keywords, tokens=None):
+        if self.hashed_counter is not None:
+            # Lemmas are streamed into the hashed counts, never into a per-document vocabulary
+            words = tokens.words if tokens is not None else word_tokenize(text.lower())
+            return self.hashed_counter.top_streamed_terms(lambda: self.iter_lemmas(words), num_keywords)
+        word_freq = self.lemma_counts(text, tokens)
         return [word for word, _ in word_freq.most_common(num_keywords)]
 
-    def extract_keywords(self, text, num_keywords):
-        tfidf_keywords = set(self.extract_tfidf_keywords(text, num_keywords))
-        freq_keywords = set(self.extract_frequency_keywords(text, num_keywords))
-        combined_keywords = list(tfidf_keywords.union(freq_keywords))
-        return combined_keywords[:num_keywords]
+    def extract_keywords(self, text, num_keywords, tokens=None):
+        """
+        :param tokens: Optional DocumentTokens of `text`; when given (typically the
+                       instance already used by the summarizer) the text is not
+                       tokenized again
+        """
+        keywords, _ = self.rank_keywords(text, num_keywords, tokens)
+        return keywords
+
+    def rank_keywords(self, text, num_keywords, tokens=None):
+        """
+        Fuse the TF-IDF, frequency and keyphrase rankings by reciprocal rank fusion.
+
+        Keywords that only differ by inflection are merged, and keyphrases absorb the
+        single words they contain.
+
+        :return: Tuple of (keywords best first, Keyphrase records of the document)
+        """
+        if tokens is None:
+            tokens = DocumentTokens(text)
+        keyphrases = self.keyphrase_extractor.extract(tokens, num_keywords)
+        rankings = [
+            self.extract_tfidf_keywords(text, num_keywords, tokens),
+            self.extract_frequency_keywords(text, num_keywords, tokens),
+            [keyphrase.phrase for keyphrase in keyphrases]
+        ]
+        keywords = reciprocal_rank_fusion(rankings, num_keywords, key=self.keyword_key, merge_phrases=True)
+        return keywords, keyphrases
+
+    def keyword_key(self, keyword):
+        lemmatize = self.lemmatizer.lemmatize
+        return " ".join(lemmatize(word) for word in keyword.split())
+
+    def keyphrases_sufficient(self, keyphrases, num_keywords):
+        """
+        Whether the local keyphrases are good enough to skip LLM refinement: at least
+        half of the requested keywords are distinct phrases that recur standing alone,
+        delimited on both sides by stop words, punctuation or verbs, rather than only
+        as pieces of longer runs.
+        """
+        standalone = sum(1 for keyphrase in keyphrases if keyphrase.runs >= MIN_STANDALONE_RUNS)
+        return standalone * 2 >= num_keywords
 
     def get_initial_keyword_count(self, num_pages):
         document_length = classify_document_length(num_pages)
@@ -75,25 +144,32 @@ class KeywordExtractor:
         """
 
         try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                model="llama3-8b-8192",
-            )
-            refined_keywords = chat_completion.choices[0].message.content.strip()
+            refined_keywords = self.llm.complete(prompt)
             #return [keyword.strip() for keyword in refined_keywords.split(',')]
             return refined_keywords
         except Exception as e:
             print(f"Error calling Groq LLM: {e}")
-            return original_keywords 
+            return format_keywords(original_keywords)
 
-    def process_document(self, text, num_pages, summary):
+    def initial_keywords(self, text, num_pages, tokens=None):
+        """
+        Rank the keywords locally and decide whether they need LLM refinement.
+
+        :return: (initial keywords, whether to refine them with the LLM)
+        """
         initial_keyword_count = self.get_initial_keyword_count(num_pages)
-        initial_keywords = self.extract_keywords(text, initial_keyword_count)
+        initial_keywords, keyphrases = self.rank_keywords(text, initial_keyword_count, tokens)
+        if self.refinement == 'never':
+            return initial_keywords, False
+        if self.refinement == 'auto' and self.keyphrases_sufficient(keyphrases, initial_keyword_count):
+            print("Keyphrases are sufficient, skipping LLM keyword refinement.")
+            return initial_keywords, False
+        return initial_keywords, True
+
+    def process_document(self, text, num_pages, summary, tokens=None, refine=True):
+        initial_keywords, needs_refinement = self.initial_keywords(text, num_pages, tokens)
+        if not (refine and needs_refinement):
+            return initial_keywords, format_keywords(initial_keywords)
         refined_keywords = self.refine_keywords_with_llm(initial_keywords, summary)
         return initial_keywords, refined_keywords
 
@@ -2021,4 +2097,4 @@ These themes focus on the operating system's responsibilities in managing the sy
     print("\nInitial Keywords:")
     print(', '.join(initial_keywords))
     print("\nRefined Keywords:")
-    print(', '.join(refined_keywords))
\ No newline at end of file
+    print(refined_keywords)
\ No newline at end of file
@@ -0,0 +1,59 @@
+import os
+from collections import Counter
+from functools import lru_cache
+from nltk.corpus import wordnet
+from nltk.stem import WordNetLemmatizer
+
+
+class CachedLemmatizer:
+    """
+    WordNetLemmatizer with a bounded per-process cache of lemmas.
+
+    Documents repeat the same few thousand words many times, so after warm-up almost
+    every lookup is a cache hit. The cache holds at most `max_size` words
+    (LEMMA_CACHE_SIZE), least recently used first out.
+    """
+
+    def __init__(self, max_size=None):
+        if max_size is None:
+            max_size = int(os.environ.get("LEMMA_CACHE_SIZE", 100000))
+        self.lemmatizer = WordNetLemmatizer()
+        self.lemmatize = lru_cache(maxsize=max_size)(self.lemmatizer.lemmatize)
+        self.is_verb_form = lru_cache(maxsize=max_size)(self._is_verb_form)
+
+    def _is_verb_form(self, word):
+        """
+        Whether `word` is an inflected verb, such as "manages" or "implemented", that
+        WordNet does not also know as a noun or an adjective.
+        """
+        return (self.lemmatize(word, 'v') != word
+                and not wordnet.synsets(word, wordnet.NOUN)
+                and not wordnet.synsets(word, wordnet.ADJ))
+
+    def stats(self):
+        info = self.lemmatize.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'hit_rate': info.hits / lookups if lookups else 0.0
+        }
+
+
+def count_lemmas(words, stop_words, lemmatize):
+    """
+    Count the lemmas of the alphabetic words that are not stop words.
+
+    Words are filtered and counted in a single pass and each distinct word is then
+    lemmatized once, so the cost of lemmatization grows with the vocabulary rather
+    than with the document length.
+
+    :param words: Iterable of lowercase tokens
+    :return: Counter of lemmas, in order of first occurrence
+    """
+    word_counts = Counter(word for word in words if word.isalpha() and word not in stop_words)
+    lemma_counts = Counter()
+    for word, count in word_counts.items():
+        lemma_counts[lemmatize(word)] += count
+    return lemma_counts
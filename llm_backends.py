@@ -0,0 +1,247 @@
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import namedtuple
+from functools import lru_cache
+from llm_cache import LLMResponseCache
+from records import estimate_token_count
+from utlis import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+ChatResult = namedtuple('ChatResult', ['text', 'total_tokens'])
+
+
+class BackendError(Exception):
+    """A chat completion request failed."""
+
+
+class BackendRateLimitError(BackendError):
+    """The provider rejected a request because a rate limit was exceeded."""
+
+
+class ChatBackend:
+    """
+    Interface of a chat-completion provider used by LLMClient.
+
+    Subclasses implement `complete`, which sends one user prompt and returns a
+    ChatResult. `rate_limited` tells LLMClient whether requests have to be admitted
+    by the shared rate limiter and `use_response_cache` whether responses may be
+    served from the LLMResponseCache.
+    """
+    name = None
+    rate_limited = True
+    use_response_cache = True
+
+    def complete(self, prompt, model):
+        raise NotImplementedError
+
+
+class GroqBackend(ChatBackend):
+    """Chat completions from the Groq API (GROQ_API_KEY)."""
+    name = 'groq'
+
+    def __init__(self, api_key=None):
+        from groq import Groq
+        self.client = Groq(api_key=api_key or os.environ.get("GROQ_API_KEY"))
+
+    def complete(self, prompt, model):
+        from groq import RateLimitError
+        try:
+            chat_completion = self.client.chat.completions.create(
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ],
+                model=model,
+            )
+        except RateLimitError as e:
+            raise BackendRateLimitError(str(e)) from e
+        usage = getattr(chat_completion, 'usage', None)
+        return ChatResult(
+            chat_completion.choices[0].message.content.strip(),
+            getattr(usage, 'total_tokens', None)
+        )
+
+
+class LocalBackend(ChatBackend):
+    """
+    Deterministic in-process stand-in for an LLM, for offline benchmarks and load tests.
+
+    Latency follows a log-normal distribution with the given mean (seconds) and shape,
+    a fraction `error_rate` of requests fails with BackendError, and the response is
+    `output_words` words drawn from the prompt. Every decision is seeded by the prompt
+    hash, so the same prompt always gets the same latency, outcome and text.
+    """
+    name = 'local'
+    rate_limited = False
+
+    def __init__(self, latency_mean=1.0, latency_sigma=0.5, error_rate=0.0, output_words=200):
+        self.latency_mean = latency_mean
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.output_words = output_words
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency_mean=float(os.environ.get("LOCAL_LLM_LATENCY_MEAN", 1.0)),
+            latency_sigma=float(os.environ.get("LOCAL_LLM_LATENCY_SIGMA", 0.5)),
+            error_rate=float(os.environ.get("LOCAL_LLM_ERROR_RATE", 0.0)),
+            output_words=int(os.environ.get("LOCAL_LLM_OUTPUT_WORDS", 200))
+        )
+
+    def complete(self, prompt, model):
+        seed = int.from_bytes(hashlib.sha256(f"{model}\0{prompt}".encode('utf-8')).digest()[:8], 'big')
+        rng = random.Random(seed)
+
+        if self.latency_mean > 0:
+            mu = math.log(self.latency_mean) - self.latency_sigma ** 2 / 2
+            time.sleep(rng.lognormvariate(mu, self.latency_sigma))
+        if rng.random() < self.error_rate:
+            raise BackendError("Simulated local backend failure")
+
+        vocabulary = re.findall(r'[A-Za-z]{3,}', prompt) or ['summary']
+        # Answer packed and combined prompts in their block format so they parse like real responses.
+        sections = re.findall(r'^### (Section \d+|Summary|Keywords)$', prompt, re.MULTILINE)
+        if sections:
+            words_per_section = max(self.output_words // len(sections), 1)
+            text = "\n\n".join(
+                f"### {header}\n" + " ".join(rng.choice(vocabulary) for _ in range(words_per_section))
+                for header in sections
+            )
+        else:
+            text = " ".join(rng.choice(vocabulary) for _ in range(self.output_words))
+        return ChatResult(text, estimate_token_count(len(prompt) + len(text)))
+
+
+class RecordingBackend(ChatBackend):
+    """
+    Wrap a backend and record every prompt/response pair to a cassette directory.
+
+    Each process appends JSON lines to its own file, so concurrent workers never
+    interleave writes. The response cache is bypassed so that every request of the
+    run ends up on the cassette.
+    """
+    use_response_cache = False
+
+    def __init__(self, backend, cassette_dir):
+        self.backend = backend
+        self.name = backend.name
+        self.rate_limited = backend.rate_limited
+        self.cassette_dir = cassette_dir
+        os.makedirs(cassette_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    def _cassette_file(self):
+        if self._file is None or self._pid != os.getpid():
+            path = os.path.join(self.cassette_dir, f"{self.name}-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl")
+            self._file = open(path, 'a', encoding='utf-8')
+            self._pid = os.getpid()
+        return self._file
+
+    def complete(self, prompt, model):
+        start_time = time.perf_counter()
+        result = self.backend.complete(prompt, model)
+        elapsed = time.perf_counter() - start_time
+        record = {
+            'key': LLMResponseCache.make_key(model, prompt),
+            'model': model,
+            'prompt': prompt,
+            'response': result.text,
+            'total_tokens': result.total_tokens,
+            'elapsed': elapsed
+        }
+        with self._lock:
+            cassette = self._cassette_file()
+            cassette.write(json.dumps(record) + "\n")
+            cassette.flush()
+        return result
+
+
+@lru_cache(maxsize=None)
+def load_cassettes(cassette_dir):
+    """
+    Load every cassette in a directory into a dictionary keyed by model and prompt hash.
+
+    Loaded once per process; prompts are not kept in memory, only the key.
+    """
+    entries = {}
+    for path in sorted(glob.glob(os.path.join(cassette_dir, "*.jsonl"))):
+        with open(path, 'r', encoding='utf-8') as cassette:
+            for line in cassette:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                entries[record['key']] = (record['response'], record.get('total_tokens'), record.get('elapsed', 0.0))
+    logger.info(f"Loaded {len(entries)} recorded LLM responses from {cassette_dir}")
+    return entries
+
+
+class ReplayBackend(ChatBackend):
+    """
+    Answer prompts from recorded cassettes without any network access.
+
+    With `timing='recorded'` each response is delayed by its original latency, with
+    `timing='zero'` it is returned immediately. A prompt that was never recorded
+    raises BackendError.
+    """
+    name = 'replay'
+    rate_limited = False
+    use_response_cache = False
+
+    def __init__(self, cassette_dir, timing='recorded'):
+        if timing not in ('recorded', 'zero'):
+            raise ValueError(f"Unknown replay timing: {timing}")
+        self.timing = timing
+        self.entries = load_cassettes(cassette_dir)
+
+    def complete(self, prompt, model):
+        key = LLMResponseCache.make_key(model, prompt)
+        entry = self.entries.get(key)
+        if entry is None:
+            raise BackendError(f"No recorded response for prompt {key[:12]}")
+        text, total_tokens, elapsed = entry
+        if self.timing == 'recorded' and elapsed:
+            time.sleep(elapsed)
+        return ChatResult(text, total_tokens)
+
+
+def create_backend(name=None):
+    """
+    Create the chat backend selected by `name` or the LLM_BACKEND variable (groq or local).
+
+    LLM_CASSETTE_MODE=record wraps it in a RecordingBackend and LLM_CASSETTE_MODE=replay
+    replaces it with a ReplayBackend reading from LLM_CASSETTE_DIR, delayed according
+    to LLM_CASSETTE_TIMING (recorded or zero).
+    """
+    cassette_mode = os.environ.get("LLM_CASSETTE_MODE")
+    cassette_dir = os.environ.get("LLM_CASSETTE_DIR") or get_cache_dir("cassettes")
+    if cassette_mode == 'replay':
+        return ReplayBackend(cassette_dir, timing=os.environ.get("LLM_CASSETTE_TIMING", "recorded"))
+
+    name = name or os.environ.get("LLM_BACKEND", "groq")
+    if name == 'groq':
+        backend = GroqBackend()
+    elif name == 'local':
+        backend = LocalBackend.from_env()
+    else:
+        raise ValueError(f"Unknown LLM backend: {name}")
+
+    if cassette_mode == 'record':
+        return RecordingBackend(backend, cassette_dir)
+    if cassette_mode:
+        raise ValueError(f"Unknown cassette mode: {cassette_mode}")
+    return backend
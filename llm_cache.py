@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from utlis import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """
+    Durable cache of LLM responses keyed by model name and prompt hash.
+
+    Backed by a SQLite database in WAL mode so that every worker process can read and
+    write it concurrently. Entries older than `ttl_seconds` are treated as misses, and
+    once the table holds more than `max_entries` rows the least recently used ones
+    are evicted. Hit and miss counters are kept per process.
+    """
+
+    # Run eviction after this many inserts rather than on every write
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, path=None, ttl_seconds=None, max_entries=None):
+        self.path = path or os.path.join(get_cache_dir("llm"), "responses.sqlite3")
+        if ttl_seconds is None:
+            ttl_seconds = float(os.environ.get("LLM_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+        if max_entries is None:
+            max_entries = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 100000))
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        # Connections must not be shared with a forked child, so reopen per process.
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            connection.commit()
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    @staticmethod
+    def make_key(model, prompt):
+        return hashlib.sha256(f"{model}\0{prompt}".encode('utf-8')).hexdigest()
+
+    def get(self, model, prompt):
+        """
+        Return the cached response for a prompt, or None on a miss.
+        """
+        key = self.make_key(model, prompt)
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, model, prompt, response):
+        """Store a response for a prompt."""
+        key = self.make_key(model, prompt)
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            connection.commit()
+            self._writes += 1
+            if self._writes % self.EVICTION_INTERVAL == 0:
+                self._evict(connection, now)
+
+    def _evict(self, connection, now):
+        connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        (count,) = connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_entries:
+            connection.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        connection.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,118 @@
+import logging
+import os
+import time
+from llm_backends import BackendRateLimitError, create_backend
+from llm_cache import LLMResponseCache
+from rate_limiter import TokenBucketRateLimiter
+from token_estimator import TokenEstimator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "llama3-8b-8192"
+
+# Tokens reserved for the completion when a request is admitted by the rate limiter;
+# the difference to the real usage is settled once the response arrives.
+COMPLETION_TOKEN_RESERVE = 512
+
+_rate_limiter = None
+_response_cache = None
+
+
+def set_rate_limiter(rate_limiter):
+    """Install the limiter shared with the other worker processes."""
+    global _rate_limiter
+    _rate_limiter = rate_limiter
+
+
+def get_rate_limiter():
+    """Return the process-wide limiter, creating a local one if none was installed."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = TokenBucketRateLimiter.from_env()
+    return _rate_limiter
+
+
+def get_response_cache():
+    """
+    Return the process-wide LLM response cache, or None if LLM_CACHE_ENABLED=0.
+    """
+    global _response_cache
+    if os.environ.get("LLM_CACHE_ENABLED", "1") == "0":
+        return None
+    if _response_cache is None:
+        _response_cache = LLMResponseCache()
+    return _response_cache
+
+
+class LLMClient:
+    """
+    Chat-completion client used by the summarizer and the keyword extractor.
+
+    Requests go to a pluggable ChatBackend (Groq by default, see create_backend).
+    Responses are served from the shared LLMResponseCache when possible. Every request
+    that reaches a rate-limited backend first waits for the shared rate limiter.
+    Rate-limit errors are retried with exponential backoff; any other error is raised
+    to the caller.
+    """
+
+    def __init__(self, model=DEFAULT_MODEL, rate_limiter=None, max_retries=3, use_cache=True, backend=None):
+        self.model = model
+        self._backend = backend
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.use_cache = use_cache
+        self.max_retries = max_retries
+        self.estimator = TokenEstimator.for_model(model)
+
+    @property
+    def backend(self):
+        # Created on first request, so pipelines that never call the LLM need no API key.
+        if self._backend is None:
+            self._backend = create_backend()
+        return self._backend
+
+    @property
+    def cache(self):
+        if self.use_cache and self.backend.use_response_cache:
+            return get_response_cache()
+        return None
+
+    @property
+    def cache_model(self):
+        # Responses of different backends must not be mixed up in the shared cache.
+        return f"{self.backend.name}:{self.model}"
+
+    def complete(self, prompt):
+        """
+        Send a single user prompt and return the stripped response text.
+
+        :param prompt: Prompt text
+        :return: Response message content
+        """
+        cache = self.cache
+        if cache is not None:
+            cached = cache.get(self.cache_model, prompt)
+            if cached is not None:
+                return cached
+        response = self._request(prompt)
+        if cache is not None and response:
+            cache.put(self.cache_model, prompt, response)
+        return response
+
+    def _request(self, prompt):
+        estimated_tokens = self.estimator.count(prompt) + COMPLETION_TOKEN_RESERVE
+        for attempt in range(self.max_retries + 1):
+            if self.backend.rate_limited:
+                self.rate_limiter.acquire(estimated_tokens)
+            try:
+                result = self.backend.complete(prompt, self.model)
+            except BackendRateLimitError:
+                if attempt == self.max_retries:
+                    raise
+                backoff = 2 ** attempt
+                logger.warning(f"LLM rate limit hit, retrying in {backoff} seconds")
+                time.sleep(backoff)
+                continue
+
+            if self.backend.rate_limited and result.total_tokens:
+                self.rate_limiter.adjust(result.total_tokens - estimated_tokens)
+            return result.text
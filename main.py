@@ -1,4 +1,4 @@
-from db_manager import DatabaseManager, create_document_schema
+from db_manager import DatabaseManager, create_document_schema, to_storage_document
 from pdf_processor import process_pdfs
 import os
 import logging
@@ -63,10 +63,9 @@ def save_metrics_to_file(results):
     
     logging.info(f"Performance metrics saved to {filepath}")
 
-def process_and_store_pdfs(pdf_folder, db_manager):
-    processed_docs = process_pdfs(pdf_folder)
-    
-    for doc in processed_docs:
+def process_and_store_pdfs(pdf_folder, db_manager, incremental=False):
+    def store(doc):
+        doc = to_storage_document(doc)
         existing_doc = db_manager.find_document("documents", {"filename": doc['filename']})
         if existing_doc:
             db_manager.update_document(
@@ -76,8 +75,9 @@ def process_and_store_pdfs(pdf_folder, db_manager):
             )
         else:
             db_manager.insert_document("documents", doc)
-    
-    return processed_docs
+
+    # Documents are stored as they complete, and only stored ones are marked as processed
+    return process_pdfs(pdf_folder, incremental=incremental, store=store)
 
 def main():
     setup_logging()
@@ -90,7 +90,9 @@ def main():
         pdf_folder = os.path.expanduser("~/Desktop/pdf_folder")
         
         # Using measure_performance to wrap the PDF processing and database operations as of now avoiding the performance_metrics.py
-        processed_docs, performance_results = measure_performance(process_and_store_pdfs, pdf_folder, db_manager)
+        # Set PDF_PIPELINE_INCREMENTAL=1 to only process files that changed since the last run
+        incremental = os.environ.get("PDF_PIPELINE_INCREMENTAL", "0") == "1"
+        processed_docs, performance_results = measure_performance(process_and_store_pdfs, pdf_folder, db_manager, incremental=incremental)
         
         logging.info(f"Processed {len(processed_docs)} documents")
         logging.info(f"Overall performance results: {performance_results}")
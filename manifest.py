@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from utlis import file_sha256, get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a change to the pipeline should cause every document to be reprocessed.
+PIPELINE_VERSION = 1
+
+
+class ProcessingManifest:
+    """
+    Record of the PDFs already processed from a folder, used for incremental runs.
+
+    For every file the manifest keeps its size, mtime, content hash and the pipeline
+    version that processed it. A file is considered unchanged when size and mtime
+    match; when only the mtime moved the content hash decides, so touching or copying
+    a file does not force it to be reprocessed.
+
+    The pipeline mode is recorded as well: files processed in 'extractive' mode are
+    processed again by a 'full' run, while 'full' results also satisfy an extractive run.
+    """
+
+    def __init__(self, path, mode='full'):
+        self.path = path
+        self.mode = mode
+        self.entries = {}
+        self.load()
+
+    @classmethod
+    def for_folder(cls, folder_path, manifest_path=None, mode='full'):
+        """
+        Open the manifest for a folder, stored in the pipeline cache unless a path is given.
+        """
+        if manifest_path is None:
+            folder_key = hashlib.sha1(os.path.abspath(folder_path).encode('utf-8')).hexdigest()
+            manifest_path = os.path.join(get_cache_dir("manifests"), f"{folder_key}.json")
+        return cls(manifest_path, mode)
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.entries = json.load(file).get('files', {})
+        except FileNotFoundError:
+            self.entries = {}
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable manifest {self.path}: {e}")
+            self.entries = {}
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump({'files': self.entries}, file, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def is_current(self, file_path):
+        """
+        Check whether a file was already processed by the current pipeline version.
+
+        :param file_path: Path to the PDF file
+        :return: True if the file is unchanged since it was recorded
+        """
+        entry = self.entries.get(os.path.abspath(file_path))
+        if entry is None or entry.get('pipeline_version') != PIPELINE_VERSION:
+            return False
+        if entry.get('mode', 'full') not in (self.mode, 'full'):
+            return False
+        stat = os.stat(file_path)
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime == entry['mtime']:
+            return True
+        if file_sha256(file_path) != entry['content_hash']:
+            return False
+        entry['mtime'] = stat.st_mtime
+        return True
+
+    def record(self, file_path, content_hash=None, mtime=None):
+        """
+        Mark a file as processed by the current pipeline version.
+
+        :param content_hash: SHA-256 of the file, if already computed while processing it
+        :param mtime: Modification time observed before `content_hash` was computed
+        """
+        stat = os.stat(file_path)
+        self.entries[os.path.abspath(file_path)] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime if mtime is None else mtime,
+            'content_hash': content_hash or file_sha256(file_path),
+            'pipeline_version': PIPELINE_VERSION,
+            'mode': self.mode
+        }
+
+    def partition(self, file_paths):
+        """
+        Split files into those that need processing and those that can be skipped.
+
+        :param file_paths: Paths of the candidate PDF files
+        :return: Tuple of (paths to process, paths skipped as unchanged)
+        """
+        to_process = []
+        skipped = []
+        for file_path in file_paths:
+            if self.is_current(file_path):
+                skipped.append(file_path)
+            else:
+                to_process.append(file_path)
+        return to_process, skipped
+
+    def prune(self, file_paths):
+        """Drop entries for files that are no longer present."""
+        keep = {os.path.abspath(file_path) for file_path in file_paths}
+        for path in list(self.entries):
+            if path not in keep:
+                del self.entries[path]
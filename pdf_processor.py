@@ -1,54 +1,202 @@
+import io
 import os
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 import logging
 import time
-from keyword_extractor import KeywordExtractor
+from corpus_idf import CorpusIDFUpdate, document_key, document_terms
+from keyword_extractor import KeywordExtractor, format_keywords
 from summarizer import DynamicSummarizer
+from token_stream import DocumentTokens
 import PyPDF2
-from PyPDF2 import PdfReader
-import re
-from utlis import extract_paragraphs_with_boundaries, merge_short_paragraphs_with_overlap
+from document_handle import PAGE_SEPARATOR, DocumentHandle, as_document_handle
+from extraction_cache import ExtractionCache
+from llm_client import get_response_cache, set_rate_limiter
+from manifest import ProcessingManifest
+from rate_limiter import TokenBucketRateLimiter
+from records import Chunk
+from utlis import file_sha256, iter_paragraphs, merge_short_paragraphs_with_overlap
 
 logger = logging.getLogger(__name__)
 
-def process_pdfs(folder_path, max_workers=4):
+PIPELINE_MODES = ('full', 'extractive')
+
+def get_pipeline_mode(mode=None):
+    """
+    Resolve the pipeline mode, defaulting to PDF_PIPELINE_MODE.
+
+    'full' summarizes with the LLM and refines keywords with it; 'extractive' builds
+    the summary from TF-IDF key sentences and keeps the unrefined keywords, so no
+    LLM request is made.
+    """
+    mode = mode or os.environ.get("PDF_PIPELINE_MODE", "full")
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode: {mode}")
+    return mode
+
+# Per-process pipeline components, created once by init_worker and reused for every
+# document the worker handles.
+_summarizer = None
+_keyword_extractor = None
+
+def init_worker(rate_limiter=None):
+    """
+    Initialize a worker process: load NLTK data, the summarizer and the keyword extractor.
+
+    Used as the ProcessPoolExecutor initializer so that this fixed cost is paid once per
+    process instead of once per document.
+
+    :param rate_limiter: TokenBucketRateLimiter shared by all workers
+    """
+    global _summarizer, _keyword_extractor
+    if rate_limiter is not None:
+        set_rate_limiter(rate_limiter)
+    if _summarizer is None:
+        _summarizer = DynamicSummarizer()
+    if _keyword_extractor is None:
+        _keyword_extractor = KeywordExtractor()
+        # WordNet is loaded lazily on first use; pay for it here rather than mid-document.
+        _keyword_extractor.lemmatizer.lemmatize("documents")
+
+def get_summarizer():
+    if _summarizer is None:
+        init_worker()
+    return _summarizer
+
+def get_keyword_extractor():
+    if _keyword_extractor is None:
+        init_worker()
+    return _keyword_extractor
+
+def process_pdfs(folder_path, max_workers=4, incremental=False, manifest_path=None, mode=None, store=None):
+    """
+    Process every PDF in a folder with a pool of worker processes.
+
+    In incremental mode a ProcessingManifest of the folder is consulted and only new or
+    modified files are scheduled; unchanged files are reported as skipped. A file is
+    recorded in the manifest only once its document has been handed to `store`
+    without error and its terms have been published to the corpus IDF, so a file
+    whose result was never persisted or counted is processed again by the next run.
+
+    Workers score keywords against the corpus IDF version current at the start of the
+    run. The terms of every stored document are folded into a CorpusIDFUpdate as it
+    completes and published as a new version every CORPUS_IDF_PUBLISH_EVERY documents
+    and at the end of the run.
+
+    :param folder_path: Folder containing the PDF files
+    :param max_workers: Number of worker processes
+    :param incremental: Skip files already processed by the current pipeline version
+    :param manifest_path: Optional location of the manifest file
+    :param mode: Pipeline mode, see get_pipeline_mode
+    :param store: Optional function persisting each processed document; documents
+                  whose store call raises are logged and left out of the result
+    :return: List of processed document dictionaries
+    """
+    mode = get_pipeline_mode(mode)
     processed_docs = []
+    idf_update = CorpusIDFUpdate()
+    publish_every = int(os.environ.get("CORPUS_IDF_PUBLISH_EVERY", 1000))
+    # Manifest entries of the stored documents whose terms are not published yet
+    pending_records = []
     pdf_files = [f for f in os.listdir(folder_path) if f.endswith('.pdf')]
-    
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        future_to_pdf = {executor.submit(process_single_pdf, os.path.join(folder_path, pdf)): pdf for pdf in pdf_files}
+
+    manifest = None
+    if incremental:
+        manifest = ProcessingManifest.for_folder(folder_path, manifest_path, mode)
+        pdf_paths = [os.path.join(folder_path, pdf) for pdf in pdf_files]
+        manifest.prune(pdf_paths)
+        to_process, skipped = manifest.partition(pdf_paths)
+        for path in skipped:
+            logger.info(f"Skipped unchanged: {os.path.basename(path)}")
+        logger.info(f"Incremental run: {len(to_process)} new or modified, {len(skipped)} unchanged")
+        pdf_files = [os.path.basename(path) for path in to_process]
+
+    def publish():
+        idf_update.publish()
+        if manifest is not None:
+            for path, content_hash, mtime in pending_records:
+                manifest.record(path, content_hash, mtime)
+            manifest.save()
+        pending_records.clear()
+
+    rate_limiter = TokenBucketRateLimiter.from_env()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(rate_limiter,)) as executor:
+        future_to_pdf = {
+            executor.submit(process_single_pdf, os.path.join(folder_path, pdf), collect_idf_terms=True, mode=mode): pdf
+            for pdf in pdf_files
+        }
         for future in as_completed(future_to_pdf):
             pdf = future_to_pdf[future]
             try:
                 doc_info = future.result()
-                processed_docs.append(doc_info)
+                key, terms = doc_info.pop('idf_terms')
                 logger.info(f"Processed: {pdf} in {doc_info['processing_time']:.2f} seconds")
+                if store is not None:
+                    store(doc_info)
+                processed_docs.append(doc_info)
             except Exception as e:
                 logger.error(f"Error processing {pdf}: {str(e)}")
-    
+                continue
+            idf_update.add(key, terms)
+            pending_records.append((os.path.join(folder_path, pdf), doc_info['content_hash'], doc_info['file_mtime']))
+            if len(pending_records) >= publish_every:
+                publish()
+    # Also saves the manifest when nothing was processed, keeping the pruned entries
+    publish()
+
     return processed_docs
 
 
 
-def process_single_pdf(file_path):
+def process_single_pdf(file_path, use_extraction_cache=True, collect_idf_terms=False, mode=None):
     """
     Process a single PDF file.
     
     :param file_path: Path to the PDF file
+    :param use_extraction_cache: Reuse extracted text and chunks of unchanged files
+    :param collect_idf_terms: Add the document's (key, terms) pair for the corpus IDF
+                              update under 'idf_terms'
+    :param mode: Pipeline mode, see get_pipeline_mode
     :return: Dictionary containing document information
     """
+    mode = get_pipeline_mode(mode)
     start_time = time.time()
-    doc_info = extract_pdf_info(file_path)
-    doc_info['content'] = extract_pdf_content(file_path)
-    doc_info['length_category'] = classify_document_length(doc_info['num_pages'])
-    paragraphs = extract_paragraphs_with_boundaries(file_path)
-    doc_info['final_paragraphs'] = merge_short_paragraphs_with_overlap(paragraphs)
-    summarystored = summarize(doc_info, file_path)
-    doc_info['summary'] = summarystored
-    doc_info['keywords'] = extract_keywords(doc_info)
+    cache = ExtractionCache() if use_extraction_cache else None
+    summarizer = get_summarizer()
+    # Taken before hashing, so a file modified meanwhile no longer matches its manifest entry
+    file_mtime = os.stat(file_path).st_mtime
+    content_hash = file_sha256(file_path)
+    document, content, chunks = extract_document(
+        file_path, cache, max_tokens=summarizer.chunk_token_budget(), estimator=summarizer.estimator,
+        content_hash=content_hash
+    )
+    with document:
+        doc_info = extract_pdf_info(document)
+        doc_info['content_hash'] = content_hash
+        doc_info['file_mtime'] = file_mtime
+        doc_info['content'] = content
+        doc_info['length_category'] = classify_document_length(doc_info['num_pages'])
+        doc_info['final_paragraphs'] = chunks
+        # Tokenized once, shared by the summarizer and the keyword extractor
+        tokens = DocumentTokens(content)
+        if mode == 'extractive':
+            doc_info['summary'] = summarizer.summarize_extractive(chunks, tokens)
+            doc_info['keywords'] = extract_keywords(doc_info, tokens, refine=False)
+        elif summarizer.combine_final_stage:
+            doc_info['summary'], doc_info['keywords'] = summarize_with_keywords(doc_info, document, tokens)
+        else:
+            doc_info['summary'] = summarize(doc_info, document, tokens)
+            doc_info['keywords'] = extract_keywords(doc_info, tokens)
+    doc_info['pipeline_mode'] = mode
+    doc_info['idf_version'] = get_keyword_extractor().corpus_idf.version
+    if collect_idf_terms:
+        doc_info['idf_terms'] = (document_key(content), document_terms(tokens.terms()))
     end_time = time.time()
     doc_info['processing_time'] = end_time - start_time
+    response_cache = get_response_cache() if mode == 'full' else None
+    if response_cache is not None:
+        logger.info(f"LLM response cache after {doc_info['filename']}: {response_cache.stats()}")
+    logger.info(f"Lemma cache after {doc_info['filename']}: {get_keyword_extractor().lemmatizer.stats()}")
     
     
     return doc_info
@@ -57,21 +205,20 @@ def extract_pdf_info(file_path):
     """
     Extract metadata from a PDF file.
     
-    :param file_path: Path to the PDF file
+    :param file_path: Path to the PDF file or an open DocumentHandle
     :return: Dictionary containing PDF metadata
     """
-    with open(file_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        num_pages = len(reader.pages)
-        metadata = reader.metadata
+    document = as_document_handle(file_path)
+    num_pages = document.num_pages
+    metadata = document.metadata
         
-    file_info = os.stat(file_path)
+    file_info = os.stat(document.path)
     file_size = file_info.st_size
     creation_time = file_info.st_ctime
     
     return {
-        'filename': os.path.basename(file_path),
-        'path': file_path,
+        'filename': os.path.basename(document.path),
+        'path': document.path,
         'num_pages': num_pages,
         'author': metadata.get('/Author', 'Unknown'),
         'creation_date': metadata.get('/CreationDate', 'Unknown'),
@@ -85,47 +232,98 @@ def extract_pdf_content(file_path):
     """
     Extract text content from a PDF file.
     
-    :param file_path: Path to the PDF file
+    :param file_path: Path to the PDF file or an open DocumentHandle
     :return: Extracted text content
     """
+    document = as_document_handle(file_path)
     try:
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            if reader.is_encrypted:
-                return handle_encrypted_pdf(file_path)
-            content = ""
-            for page in reader.pages:
-                content += page.extract_text() + "\n"
-        return content
+        if document.is_encrypted:
+            return handle_encrypted_pdf(document.path)
+        return document.text()
     except PyPDF2.errors.PdfReadError as e:
-        logging.error(f"Error reading PDF {file_path}: {str(e)}")
+        logging.error(f"Error reading PDF {document.path}: {str(e)}")
         return ""
 
-def extract_paragraphs_with_boundaries(file_path):
-    reader = PdfReader(file_path)
-    if reader.is_encrypted:
-        return handle_encrypted_pdf(file_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text()
-
-    paragraphs = re.split(r'\n\s*\n', text.strip())
-    paragraph_info = []
-    current_position = 0
-
-    for para_index, paragraph in enumerate(paragraphs):
-        paragraph_start = current_position
-        paragraph_end = paragraph_start + len(paragraph)
-        current_position = paragraph_end + 2
-        
-        paragraph_info.append({
-            'paragraph_index': para_index + 1,
-            'paragraph_start': paragraph_start,
-            'paragraph_end': paragraph_end,
-            'paragraph_text': paragraph
+def extract_document(file_path, cache=None, max_tokens=None, estimator=None, content_hash=None):
+    """
+    Extract the text and chunks of a PDF, reusing a cached extraction when available.
+
+    On a cache hit the returned handle is rebuilt from the cached text and metadata,
+    so PyPDF2 never parses the file. Entries chunked with a different token budget
+    are treated as misses.
+
+    :param file_path: Path to the PDF file
+    :param cache: Optional ExtractionCache keyed by the file content hash
+    :param max_tokens: Token budget per chunk (see DynamicSummarizer.chunk_token_budget);
+                       chunks are sized in words when omitted
+    :param estimator: TokenEstimator of the summarization model
+    :param content_hash: SHA-256 of the file when the caller already computed it
+    :return: Tuple of (DocumentHandle, text content, list of Chunk records)
+    """
+    if cache is not None:
+        if content_hash is None:
+            content_hash = file_sha256(file_path)
+        entry = cache.get(content_hash)
+        if entry is not None and entry.get('chunk_tokens') == max_tokens:
+            logger.info(f"Extraction cache hit for {file_path}")
+            content = entry['content']
+            document = DocumentHandle.from_extraction(
+                file_path, entry['num_pages'], entry['metadata'], content, entry['page_offsets']
+            )
+            chunks = [Chunk(index + 1, content, *row) for index, row in enumerate(entry['chunks'])]
+            return document, content, chunks
+
+    document = DocumentHandle(file_path, cache_pages=False)
+    # With a token budget the chunker packs paragraphs itself, so they are not capped
+    content, paragraphs = extract_content_and_paragraphs(document, max_words=None if max_tokens else 1500)
+    chunks = merge_short_paragraphs_with_overlap(
+        paragraphs, text=content, max_tokens=max_tokens, estimator=estimator, page_offsets=document.page_offsets
+    )
+
+    if cache is not None and content and not document.is_encrypted:
+        cache.put(content_hash, {
+            'num_pages': document.num_pages,
+            'metadata': {key: str(value) for key, value in document.metadata.items()},
+            'content': content,
+            'page_offsets': document.page_offsets,
+            'chunk_tokens': max_tokens,
+            'chunks': [
+                [chunk.start, chunk.end, chunk.page_start, chunk.page_end, chunk.word_count, chunk.token_count]
+                for chunk in chunks
+            ]
         })
+    return document, content, chunks
+
+def extract_content_and_paragraphs(document, max_words=1500):
+    """
+    Extract the text content and the paragraphs of a PDF in a single streaming pass.
 
-    return paragraph_info
+    Each page is extracted once, written to a text buffer and split into paragraphs
+    as it is yielded, so only the current page is held besides the buffer. The buffer
+    is copied into the content string once at the end. Paragraphs are offsets into
+    the content, the one full copy of the text that is kept, because keyword
+    extraction and the chunk slices need it.
+
+    :param document: Open DocumentHandle
+    :param max_words: Maximum number of words per paragraph, or None for no limit
+    :return: Tuple of (text content, list of paragraph records)
+    """
+    try:
+        if document.is_encrypted:
+            return handle_encrypted_pdf(document.path), []
+        buffer = io.StringIO()
+
+        def buffered_pages():
+            for page in document.iter_pages():
+                buffer.write(page.text)
+                buffer.write(PAGE_SEPARATOR)
+                yield page
+
+        paragraphs = list(iter_paragraphs(buffered_pages(), max_words))
+        return buffer.getvalue(), paragraphs
+    except PyPDF2.errors.PdfReadError as e:
+        logging.error(f"Error reading PDF {document.path}: {str(e)}")
+        return "", []
 
 def merge_short_paragraphs(paragraphs, word_threshold=150):
     merged_paragraphs = []
@@ -178,36 +376,71 @@ def handle_encrypted_pdf(file_path):
     logging.warning(f"Encrypted PDF detected: {file_path}")
     return "This PDF is encrypted and cannot be processed without a password."
 
-def extract_keywords(doc_info):
+def extract_keywords(doc_info, tokens=None, refine=True):
     """
     Extract keywords from the document content.
     
     :param doc_info: Dictionary containing document information
-    :return: List of extracted keywords
+    :param tokens: Optional DocumentTokens of the content
+    :param refine: Refine the extracted keywords with the LLM
+    :return: Comma-separated keywords, refined or not
     """
-    extractor = KeywordExtractor()
+    extractor = get_keyword_extractor()
     initial_keywords, refined_keywords = extractor.process_document(
         doc_info['content'], 
         doc_info['num_pages'], 
-        doc_info['summary']
+        doc_info['summary'],
+        tokens,
+        refine=refine
     )
     return refined_keywords 
 
-def summarize(doc_info, file_path):
+def summarize(doc_info, document, tokens=None):
     """
     Summarize the document content.
     
     :param doc_info: Dictionary containing document information
-    :param file_path: Path to the PDF file
+    :param document: Path to the PDF file or an open DocumentHandle
+    :param tokens: Optional DocumentTokens of the content
     :return: String containing the document summary
     """
-    summarizer = DynamicSummarizer()
-    summary = summarizer.summarize_document(doc_info['final_paragraphs'], file_path)
+    summarizer = get_summarizer()
+    summary = summarizer.summarize_document(doc_info['final_paragraphs'], document, tokens)
     
     logging.info(f"Summary for {doc_info['filename']}: {summary}")
     
     return summary  
 
+def summarize_with_keywords(doc_info, document, tokens=None):
+    """
+    Summarize the document and refine its keywords in the same final LLM request.
+
+    The keywords are extracted locally first and handed to the final summary request.
+    If the response does not contain them, they are refined with a separate request
+    as in extract_keywords; keywords that need no refinement leave the final request
+    unchanged.
+
+    :param doc_info: Dictionary containing document information
+    :param document: Path to the PDF file or an open DocumentHandle
+    :param tokens: Optional DocumentTokens of the content
+    :return: (summary, comma-separated keywords)
+    """
+    summarizer = get_summarizer()
+    extractor = get_keyword_extractor()
+    initial_keywords, needs_refinement = extractor.initial_keywords(
+        doc_info['content'], doc_info['num_pages'], tokens
+    )
+    if not needs_refinement:
+        return summarize(doc_info, document, tokens), format_keywords(initial_keywords)
+
+    summary, refined_keywords = summarizer.summarize_document_with_keywords(
+        doc_info['final_paragraphs'], document, initial_keywords, tokens
+    )
+    logging.info(f"Summary for {doc_info['filename']}: {summary}")
+    if refined_keywords is None:
+        refined_keywords = extractor.refine_keywords_with_llm(initial_keywords, summary)
+    return summary, refined_keywords
+
 if __name__ == "__main__":
     folder_path = "C:\\Users\\kisha\\Desktop\\pdf_folder"
     processed_docs = process_pdfs(folder_path)
@@ -215,6 +448,6 @@ if __name__ == "__main__":
         print(f"Processed: {doc['filename']}")
         print(f"Number of pages: {doc['num_pages']}")
         
-        print(f"Refined Keywords: {', '.join(doc['keywords'])}")
+        print(f"Refined Keywords: {doc['keywords']}")
         print(f"Summary: {doc['summary']}")
         print("---")
\ No newline at end of file
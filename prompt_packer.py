@@ -0,0 +1,121 @@
+import re
+from records import estimate_token_count
+
+PACKED_PROMPT_HEADER = (
+    "You are a helpful chatbot and an expert in extracting the main themes from a given document. "
+    "You have been provided {count} consecutive sections of a larger document below. "
+    "For each section separately, please identify the main themes. Avoid unnecessary introduction in the response.\n\n"
+    "Answer with one block per section, in the same order, and start every block with a line "
+    "containing only the section header exactly as given, for example '### Section 1'.\n\n"
+)
+
+SECTION_HEADER = re.compile(r'^[ \t]*#*[ \t]*\**[ \t]*Section[ \t]+(\d+)[ \t]*:?[ \t]*\**[ \t]*:?[ \t]*$', re.MULTILINE | re.IGNORECASE)
+
+# Tokens of the packed prompt that do not come from the sections themselves
+PACKED_PROMPT_OVERHEAD = estimate_token_count(len(PACKED_PROMPT_HEADER)) + 16
+
+
+def section_text(sentences):
+    return ' '.join(sentences)
+
+
+def pack_sections(sections, token_budget, max_sections, count_tokens=None):
+    """
+    Group consecutive sections into packs that fit one request.
+
+    A pack is closed when adding the next section would push its estimated prompt
+    size past `token_budget` or when it holds `max_sections` sections. A section that
+    alone exceeds the budget forms a pack of its own. Sections are consumed lazily, so
+    packs can be dispatched while later sections are still being prepared.
+
+    :param sections: Iterable of key-sentence lists, one per chunk
+    :param token_budget: Maximum estimated prompt tokens per pack
+    :param max_sections: Maximum number of sections per pack
+    :param count_tokens: Function estimating the tokens of a text, such as
+                         TokenEstimator.count; defaults to a characters-based estimate
+    :return: Generator of lists of sections
+    """
+    if count_tokens is None:
+        count_tokens = lambda text: estimate_token_count(len(text))
+    pack = []
+    pack_tokens = PACKED_PROMPT_OVERHEAD
+    for sentences in sections:
+        tokens = count_tokens(section_text(sentences)) + 8
+        if pack and (pack_tokens + tokens > token_budget or len(pack) >= max_sections):
+            yield pack
+            pack = []
+            pack_tokens = PACKED_PROMPT_OVERHEAD
+        pack.append(sentences)
+        pack_tokens += tokens
+    if pack:
+        yield pack
+
+
+def build_packed_prompt(pack):
+    """Build one prompt asking for the themes of every section in the pack."""
+    parts = [PACKED_PROMPT_HEADER.format(count=len(pack))]
+    for number, sentences in enumerate(pack, start=1):
+        parts.append(f"### Section {number}\n{section_text(sentences)}\n\n")
+    return "".join(parts)
+
+
+def parse_packed_response(response, num_sections):
+    """
+    Split a packed response into per-section themes.
+
+    :return: List of `num_sections` texts in section order, or None if the response
+             does not contain exactly one non-empty block per section
+    """
+    matches = list(SECTION_HEADER.finditer(response))
+    blocks = {}
+    for position, match in enumerate(matches):
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(response)
+        number = int(match.group(1))
+        text = response[match.end():end].strip()
+        if number in blocks or not text:
+            return None
+        blocks[number] = text
+    if sorted(blocks) != list(range(1, num_sections + 1)):
+        return None
+    return [blocks[number] for number in range(1, num_sections + 1)]
+
+
+COMBINED_PROMPT_SUFFIX = (
+    "\n\nIn the same answer, also provide a refined list of keywords that best represent the main themes "
+    "and concepts of the document, based on the summary and on these initially extracted keywords: {keywords}\n"
+    "Use your judgment to determine the appropriate number of keywords; aim for a concise yet comprehensive set.\n\n"
+    "Answer with exactly two blocks, each starting with a line containing only its header:\n"
+    "### Summary\n"
+    "### Keywords\n"
+    "The Keywords block lists the refined keywords separated by commas."
+)
+
+COMBINED_HEADER = re.compile(r'^[ \t]*#*[ \t]*\**[ \t]*(Summary|Keywords)[ \t]*:?[ \t]*\**[ \t]*:?[ \t]*$', re.MULTILINE | re.IGNORECASE)
+
+
+def build_combined_prompt(summary_prompt, keywords):
+    """
+    Extend a summary prompt so that the same request also returns the refined keywords.
+    """
+    return summary_prompt + COMBINED_PROMPT_SUFFIX.format(keywords=', '.join(keywords))
+
+
+def parse_combined_response(response):
+    """
+    Split a combined response into the summary and the refined keywords.
+
+    :return: (summary, keywords) texts; either is None when its block is missing,
+             empty or repeated
+    """
+    blocks = {}
+    repeated = set()
+    matches = list(COMBINED_HEADER.finditer(response))
+    for position, match in enumerate(matches):
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(response)
+        name = match.group(1).lower()
+        if name in blocks:
+            repeated.add(name)
+        blocks[name] = response[match.end():end].strip() or None
+    for name in repeated:
+        blocks[name] = None
+    return blocks.get('summary'), blocks.get('keywords')
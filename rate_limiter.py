@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+import time
+
+# Indices into the shared state array
+_REQUESTS, _TOKENS, _LAST_REFILL = range(3)
+
+
+class TokenBucketRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute token buckets shared by every process.
+
+    The bucket levels live in a shared-memory array guarded by a multiprocessing lock,
+    so all worker processes (and the threads inside them) draw from the same budget.
+    Create the limiter in the parent process and hand it to the workers through the
+    pool initializer. Both buckets start full and refill continuously.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = float(requests_per_minute)
+        self.tokens_per_minute = float(tokens_per_minute)
+        self._lock = multiprocessing.Lock()
+        self._state = multiprocessing.RawArray('d', 3)
+        self._state[_REQUESTS] = self.requests_per_minute
+        self._state[_TOKENS] = self.tokens_per_minute
+        self._state[_LAST_REFILL] = time.monotonic()
+
+    @classmethod
+    def from_env(cls):
+        """Build a limiter from LLM_REQUESTS_PER_MINUTE and LLM_TOKENS_PER_MINUTE."""
+        return cls(
+            requests_per_minute=float(os.environ.get("LLM_REQUESTS_PER_MINUTE", 30)),
+            tokens_per_minute=float(os.environ.get("LLM_TOKENS_PER_MINUTE", 30000))
+        )
+
+    def _refill(self, now):
+        elapsed = max(now - self._state[_LAST_REFILL], 0.0)
+        self._state[_REQUESTS] = min(self.requests_per_minute,
+                                     self._state[_REQUESTS] + elapsed * self.requests_per_minute / 60.0)
+        self._state[_TOKENS] = min(self.tokens_per_minute,
+                                   self._state[_TOKENS] + elapsed * self.tokens_per_minute / 60.0)
+        self._state[_LAST_REFILL] = now
+
+    def acquire(self, tokens):
+        """
+        Block until one request and `tokens` tokens are available, then consume them.
+
+        Requests larger than the per-minute token budget are clamped to the budget so
+        they wait for a full bucket instead of blocking forever.
+
+        :param tokens: Estimated number of tokens the request will use
+        :return: Seconds spent waiting
+        """
+        tokens = min(float(tokens), self.tokens_per_minute)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                missing_requests = 1.0 - self._state[_REQUESTS]
+                missing_tokens = tokens - self._state[_TOKENS]
+                if missing_requests <= 0 and missing_tokens <= 0:
+                    self._state[_REQUESTS] -= 1.0
+                    self._state[_TOKENS] -= tokens
+                    return waited
+                delay = max(missing_requests * 60.0 / self.requests_per_minute,
+                            missing_tokens * 60.0 / self.tokens_per_minute)
+            time.sleep(delay)
+            waited += delay
+
+    def adjust(self, tokens):
+        """
+        Correct the token bucket once the real usage of a request is known.
+
+        :param tokens: Actual minus estimated tokens; negative values give tokens back
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._state[_TOKENS] = min(self.tokens_per_minute, self._state[_TOKENS] - tokens)
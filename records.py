@@ -0,0 +1,79 @@
+def estimate_token_count(num_chars):
+    """Rough LLM token estimate for a span of text (about four characters per token)."""
+    return (num_chars + 3) // 4
+
+
+class Paragraph:
+    """
+    A paragraph produced by the chunker.
+
+    Offsets index into the document text, and the paragraph is sliced from it on
+    demand as ``document_text[start:end]`` rather than holding a copy of its text.
+    Page numbers are one-based and inclusive.
+    """
+    __slots__ = ('index', 'start', 'end', 'page_start', 'page_end', 'word_count')
+
+    def __init__(self, index, start, end, page_start, page_end, word_count):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.page_start = page_start
+        self.page_end = page_end
+        self.word_count = word_count
+
+    def __repr__(self):
+        return (f"Paragraph(index={self.index}, start={self.start}, end={self.end}, "
+                f"pages={self.page_start}-{self.page_end}, word_count={self.word_count})")
+
+    def to_dict(self):
+        return {
+            'paragraph_index': self.index,
+            'paragraph_start': self.start,
+            'paragraph_end': self.end,
+            'page_start': self.page_start,
+            'page_end': self.page_end,
+            'word_count': self.word_count
+        }
+
+
+class Chunk:
+    """
+    A merged chunk, stored as a [start, end) character slice of the document text.
+
+    The chunk string is only built when ``text`` is read, i.e. when a prompt is
+    assembled, so holding the chunk list costs a handful of integers per chunk.
+    """
+    __slots__ = ('index', 'source', 'start', 'end', 'page_start', 'page_end', 'word_count', 'token_count')
+
+    def __init__(self, index, source, start, end, page_start, page_end, word_count, token_count=None):
+        self.index = index
+        self.source = source
+        self.start = start
+        self.end = end
+        self.page_start = page_start
+        self.page_end = page_end
+        self.word_count = word_count
+        self.token_count = estimate_token_count(end - start) if token_count is None else token_count
+
+    @property
+    def text(self):
+        return self.source[self.start:self.end]
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return (f"Chunk(index={self.index}, start={self.start}, end={self.end}, "
+                f"pages={self.page_start}-{self.page_end}, word_count={self.word_count}, "
+                f"token_count={self.token_count})")
+
+    def to_dict(self):
+        return {
+            'chunk_index': self.index,
+            'start': self.start,
+            'end': self.end,
+            'page_start': self.page_start,
+            'page_end': self.page_end,
+            'word_count': self.word_count,
+            'token_count': self.token_count
+        }
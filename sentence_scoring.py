@@ -0,0 +1,247 @@
+import math
+import os
+from collections import namedtuple
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Sentences of one chunk with their TF-IDF scores and word counts (numpy arrays)
+ScoredSentences = namedtuple('ScoredSentences', ['sentences', 'scores', 'word_counts'])
+
+
+def _identity(terms):
+    return terms
+
+
+class DocumentSentenceScorer:
+    """
+    Score the sentences of all chunks of a document with one shared TF-IDF model.
+
+    Sentences and words come from the document's DocumentTokens, so nothing is
+    tokenized again. A single sparse TF-IDF matrix is fitted over the index terms of
+    all sentences of the document and a sentence's score is its sparse row mean, so
+    the matrix is never densified.
+    """
+
+    def score_document(self, tokens, spans):
+        """
+        :param tokens: DocumentTokens of the document
+        :param spans: Iterable of (start, end) character spans, one per chunk
+        :return: List of ScoredSentences, one per chunk
+        """
+        sentences_per_chunk = [list(tokens.span_sentences(start, end)) for start, end in spans]
+        all_sentences = [sentence for sentences in sentences_per_chunk for sentence in sentences]
+        word_counts = np.fromiter(
+            (last_word - first_word for _, _, first_word, last_word in all_sentences),
+            dtype=np.int64, count=len(all_sentences)
+        )
+        scores = np.zeros(len(all_sentences))
+        if all_sentences:
+            try:
+                tfidf_matrix = TfidfVectorizer(analyzer=_identity).fit_transform(
+                    tokens.terms(first_word, last_word) for _, _, first_word, last_word in all_sentences
+                )
+                scores = np.asarray(tfidf_matrix.mean(axis=1)).ravel()
+            except ValueError:
+                # Only stop words in the whole document: no vocabulary to score with
+                pass
+
+        scored = []
+        offset = 0
+        for sentences in sentences_per_chunk:
+            end = offset + len(sentences)
+            scored.append(ScoredSentences(
+                [sentence for _, sentence, _, _ in sentences], scores[offset:end], word_counts[offset:end]
+            ))
+            offset = end
+        return scored
+
+
+class TextRankSentenceScorer:
+    """
+    Score sentences with TextRank over a sparse similarity graph of the whole document.
+
+    Every sentence of the document is a node linked to its `top_k` most similar
+    sentences by TF-IDF cosine similarity, and the scores are the PageRank of that
+    graph computed by power iteration on sparse matrices. Central sentences, whose
+    content recurs across the document, rank high regardless of their length, and
+    sentences repeated in several chunks share one score.
+
+    Only sentences sharing a term are compared: candidate pairs come from a sparse
+    product of the TF-IDF matrix with an inverted index in which every term keeps the
+    `max_term_sentences` sentences where it weighs most. Each term occurrence thus
+    yields at most that many candidates, so the cost grows linearly with the document
+    instead of quadratically, and nothing is densified. The neighbours kept get their
+    exact similarity. Pairs are generated in blocks of `block_size` rows.
+    """
+
+    def __init__(self, top_k=10, damping=0.85, max_iterations=100, tolerance=1e-6, block_size=512,
+                 max_term_sentences=100):
+        self.top_k = top_k
+        self.damping = damping
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.block_size = block_size
+        self.max_term_sentences = max_term_sentences
+
+    def score_document(self, tokens, spans):
+        """
+        :param tokens: DocumentTokens of the document
+        :param spans: Iterable of (start, end) character spans, one per chunk
+        :return: List of ScoredSentences, one per chunk
+        """
+        ranks = self.rank(tokens)
+        scored = []
+        for start, end in spans:
+            sentences = list(tokens.span_sentences(start, end))
+            scored.append(ScoredSentences(
+                [sentence for _, sentence, _, _ in sentences],
+                np.fromiter((ranks[index] for index, _, _, _ in sentences), dtype=float, count=len(sentences)),
+                np.fromiter((last_word - first_word for _, _, first_word, last_word in sentences),
+                            dtype=np.int64, count=len(sentences))
+            ))
+        return scored
+
+    def rank(self, tokens):
+        """TextRank score of every sentence of the document."""
+        num_sentences = tokens.num_sentences
+        if num_sentences == 0:
+            return np.zeros(0)
+        try:
+            tfidf_matrix = TfidfVectorizer(analyzer=_identity).fit_transform(
+                tokens.terms(*tokens.sentence_words(index)) for index in range(num_sentences)
+            )
+        except ValueError:
+            return np.full(num_sentences, 1.0 / num_sentences)
+        return self.pagerank(self.similarity_graph(tfidf_matrix))
+
+    def similarity_graph(self, tfidf_matrix):
+        """
+        Symmetric sparse graph keeping, for every sentence, the edges to its `top_k`
+        most similar sentences (rows of the TF-IDF matrix are L2-normalized, so the
+        dot product is the cosine similarity).
+        """
+        num_sentences = tfidf_matrix.shape[0]
+        top_k = min(self.top_k, num_sentences - 1)
+        if top_k <= 0:
+            return sparse.csr_matrix((num_sentences, num_sentences))
+
+        tfidf_matrix = tfidf_matrix.tocsr()
+        postings = self.truncated_postings(tfidf_matrix)
+
+        rows, cols, values = [], [], []
+        for start in range(0, num_sentences, self.block_size):
+            stop = min(start + self.block_size, num_sentences)
+            pairs = (tfidf_matrix[start:stop] @ postings).tocsr()
+            pair_rows = np.repeat(np.arange(start, stop), np.diff(pairs.indptr))
+            diagonal = pairs.indices == pair_rows
+            # Partial scores are in (0, 1], so this key orders pairs by row and, within a
+            # row, by decreasing score with the sentence itself last
+            key = pair_rows - 0.5 * np.where(diagonal, -0.5, pairs.data)
+            order = np.argsort(key)
+            rank_in_row = np.arange(len(order)) - np.repeat(pairs.indptr[:-1], np.diff(pairs.indptr))
+            keep = order[(rank_in_row < top_k) & ~diagonal[order]]
+            pair_rows, pair_cols = pair_rows[keep], pairs.indices[keep]
+            weights = np.asarray(
+                tfidf_matrix[pair_rows].multiply(tfidf_matrix[pair_cols]).sum(axis=1)
+            ).ravel()
+            rows.append(pair_rows)
+            cols.append(pair_cols)
+            values.append(weights)
+
+        graph = sparse.csr_matrix(
+            (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(num_sentences, num_sentences)
+        )
+        return graph.maximum(graph.T)
+
+    def truncated_postings(self, tfidf_matrix):
+        """
+        Inverted index of the TF-IDF matrix (terms x sentences) in which every term
+        keeps only the `max_term_sentences` sentences where its weight is highest.
+        """
+        postings = tfidf_matrix.T.tocoo()
+        order = np.lexsort((-postings.data, postings.row))
+        terms = postings.row[order]
+        rank_in_term = np.arange(len(terms)) - np.searchsorted(terms, terms)
+        keep = order[rank_in_term < self.max_term_sentences]
+        return sparse.csr_matrix(
+            (postings.data[keep], (postings.row[keep], postings.col[keep])), shape=postings.shape
+        )
+
+    def pagerank(self, graph):
+        """Stationary distribution of the random walk on `graph`, by power iteration."""
+        num_sentences = graph.shape[0]
+        out_weights = np.asarray(graph.sum(axis=1)).ravel()
+        dangling = out_weights == 0
+        inverse = np.divide(1.0, out_weights, out=np.zeros(num_sentences), where=~dangling)
+        transition_t = (sparse.diags(inverse) @ graph).T.tocsr()
+
+        ranks = np.full(num_sentences, 1.0 / num_sentences)
+        for _ in range(self.max_iterations):
+            updated = (1 - self.damping) / num_sentences + self.damping * (
+                transition_t @ ranks + ranks[dangling].sum() / num_sentences
+            )
+            converged = np.abs(updated - ranks).sum() < self.tolerance
+            ranks = updated
+            if converged:
+                break
+        return ranks
+
+
+def create_sentence_scorer(name=None):
+    """
+    Create the sentence scorer selected by `name` or the SENTENCE_SCORER variable:
+    'tfidf' (mean TF-IDF per sentence) or 'textrank'.
+    """
+    name = name or os.environ.get("SENTENCE_SCORER", "tfidf")
+    if name == 'tfidf':
+        return DocumentSentenceScorer()
+    if name == 'textrank':
+        return TextRankSentenceScorer(top_k=int(os.environ.get("TEXTRANK_TOP_K", 10)))
+    raise ValueError(f"Unknown sentence scorer: {name}")
+
+
+def ranked_prefix(scores, word_counts, words_to_select):
+    """
+    Indices of the best-scored sentences, best first, up to and including the first
+    one at which the cumulative word count reaches `words_to_select`.
+
+    Only the top candidates are sorted: their number is guessed from the average
+    sentence length and doubled until they cover the target.
+    """
+    num_sentences = len(scores)
+    average_words = word_counts.sum() / num_sentences
+    if average_words > 0:
+        candidates = min(num_sentences, 2 * math.ceil(words_to_select / average_words) + 1)
+    else:
+        candidates = num_sentences
+    while True:
+        if candidates < num_sentences:
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+        else:
+            top = np.arange(num_sentences)
+        order = top[np.argsort(-scores[top], kind='stable')]
+        cumulative = np.cumsum(word_counts[order])
+        if cumulative[-1] >= words_to_select or candidates == num_sentences:
+            stop = int(np.searchsorted(cumulative, words_to_select)) + 1
+            return order[:stop]
+        candidates = min(num_sentences, 2 * candidates)
+
+
+def select_top_sentences(scored, ratio=0.5, document_order=False):
+    """
+    Select the highest-scoring sentences of a chunk until they cover `ratio` of its words.
+
+    :param scored: ScoredSentences of the chunk
+    :param document_order: Return the selection in the order of the text instead of
+                           in score order
+    :return: Tuple of (selected sentences, selected word count, target word count)
+    """
+    if not scored.sentences:
+        return [], 0, 0
+    words_to_select = int(scored.word_counts.sum() * ratio)
+    order = ranked_prefix(scored.scores, scored.word_counts, words_to_select)
+    if document_order:
+        order = np.sort(order)
+    return [scored.sentences[i] for i in order], int(scored.word_counts[order].sum()), words_to_select
@@ -1,61 +1,63 @@
+import asyncio
 import os
-import nltk
-import numpy as np
-from nltk.tokenize import sent_tokenize, word_tokenize
-from sklearn.feature_extraction.text import TfidfVectorizer
-from groq import Groq
-from utlis import extract_paragraphs_with_boundaries, merge_short_paragraphs_with_overlap
-from PyPDF2 import PdfReader  # For getting the number of pages from the PDF
+from concurrent.futures import ThreadPoolExecutor
+from llm_client import LLMClient
+from prompt_packer import (build_combined_prompt, build_packed_prompt, pack_sections,
+                           parse_combined_response, parse_packed_response)
+from sentence_scoring import create_sentence_scorer, select_top_sentences
+from token_estimator import TokenEstimator
+from token_stream import DocumentTokens
+from utlis import ensure_nltk_data, extract_paragraphs_with_boundaries, merge_short_paragraphs_with_overlap
+from document_handle import DocumentHandle, as_document_handle
 
+# Tokens of the context window kept free for the response to a chunk request
+CHUNK_RESPONSE_TOKENS = 1024
+# Tokens kept free for the final summary, which is asked to be as long as its input
+FINAL_RESPONSE_TOKENS = 2048
+# Share of each chunk's words kept by the extractive summary (EXTRACTIVE_SUMMARY_RATIO)
+EXTRACTIVE_SUMMARY_RATIO = 0.1
+# Tokens kept free for the refined keywords of a combined final request
+KEYWORDS_RESPONSE_TOKENS = 256
 
-nltk.download('punkt')
 
 class DynamicSummarizer:
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer(stop_words='english')
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+    def __init__(self, max_concurrency=None, sentence_scorer=None):
+        ensure_nltk_data()
+        # Maximum number of chunk summaries in flight at once (LLM_MAX_CONCURRENCY)
+        self.max_concurrency = max_concurrency or int(os.environ.get("LLM_MAX_CONCURRENCY", 4))
+        self.llm = LLMClient()
+        self.estimator = TokenEstimator.for_model(self.llm.model)
+        # Key sentences of consecutive chunks are packed into one request up to this many
+        # estimated prompt tokens, by default all the window leaves beside the response
+        # (LLM_PACK_TOKEN_BUDGET, 0 disables packing)
+        self.pack_token_budget = int(os.environ.get("LLM_PACK_TOKEN_BUDGET", self.request_token_budget()))
+        self.pack_max_sections = int(os.environ.get("LLM_PACK_MAX_SECTIONS", 6))
+        # Ranks the sentences of every chunk: 'tfidf' or 'textrank' (SENTENCE_SCORER)
+        self.scorer = create_sentence_scorer(sentence_scorer)
+        # Share of each chunk's words sent to the LLM as key sentences (KEY_SENTENCE_RATIO)
+        self.key_sentence_ratio = float(os.environ.get("KEY_SENTENCE_RATIO", 0.5))
+        # Ask for the refined keywords in the final summary request (LLM_COMBINED_FINAL_STAGE)
+        self.combine_final_stage = os.environ.get("LLM_COMBINED_FINAL_STAGE", "0") == "1"
 
     def extract_key_sentences(self, paragraph, ratio=0.5):
         """
         Extract key sentences from the paragraph based on TF-IDF scores.
         Adjust the number of sentences based on paragraph length.
         """
-        sentences = sent_tokenize(paragraph)
-        num_sentences = len(sentences)
-        
-        if num_sentences == 0:
-            return [] 
-        
-        print(f"Processing paragraph with {num_sentences} sentences.")
-        
-        # convert sentences to TF-IDF representation
-        tfidf_matrix = self.vectorizer.fit_transform(sentences)
-        sentence_scores = np.mean(tfidf_matrix.toarray(), axis=1)  # score by averaging TF-IDF values
-
-        # determine how many sentences to select based on the length of the paragraph
-        total_words = sum(len(word_tokenize(sent)) for sent in sentences)
-        words_to_select = int(total_words * ratio) 
-        selected_sentences = []
-        selected_word_count = 0
-        
-        # Sort sentences by their TF-IDF scores in descending order
-        sorted_indices = np.argsort(sentence_scores)[::-1]
-        for idx in sorted_indices:
-            selected_sentences.append(sentences[idx])
-            selected_word_count += len(word_tokenize(sentences[idx]))
-            if selected_word_count >= words_to_select:
-                break
-        
+        (scored,) = self.scorer.score_document(DocumentTokens(paragraph), [(0, len(paragraph))])
+        return self.select_key_sentences(scored, ratio)
+
+    def select_key_sentences(self, scored, ratio=0.5):
+        if not scored.sentences:
+            return []
+        print(f"Processing paragraph with {len(scored.sentences)} sentences.")
+        selected_sentences, selected_word_count, words_to_select = select_top_sentences(scored, ratio)
         print(f"Selected {len(selected_sentences)} sentences covering {selected_word_count} words (target was {words_to_select} words).")
-        
         return selected_sentences
 
-    def call_llm(self, sentences, is_final_summary=False):
-        """
-        Call the Groq LLM to generate a summary based on the key sentences.
-        """
+    def build_prompt(self, sentences, is_final_summary=False):
         if is_final_summary:
-            prompt = (
+            return (
                 "You have now received summaries of various sections of a larger document. "
                 "Based on these partial summaries, generate a final,summary by just removing the annotation like here is the , hte documents etc. and captures the overall each thing as descriptive as in partial ones."
                 "main themes and key points of the document. Ensure the final summary flows smoothly "
@@ -63,75 +65,353 @@ class DynamicSummarizer:
                 f"{' '.join(sentences)}\n\n"
                 "Generate the final, summary file with size same exactly same as the input or even bigger include evrything literally evrything properly just concatenate evrything well and strucutred so that it is descriptive based on the above content."
             )
-        else:
-            prompt = (
-                "You are a helpful chatbot and an expert in extracting the main themes from a given document. "
-                "You have been provided a set of documents below:\n\n"
-                f"{' '.join(sentences)}\n\n"
-                "Based on this set of documents, please identify the main themes. Avoid unnecessary introduction in the response."
-            )
+        return (
+            "You are a helpful chatbot and an expert in extracting the main themes from a given document. "
+            "You have been provided a set of documents below:\n\n"
+            f"{' '.join(sentences)}\n\n"
+            "Based on this set of documents, please identify the main themes. Avoid unnecessary introduction in the response."
+        )
+
+    def build_reduce_prompt(self, summaries):
+        return (
+            "You have been provided summaries of consecutive sections of a larger document. "
+            "Merge them into a single summary of this part of the document that keeps every main theme "
+            "and key point, in the order they appear, without repetition. Avoid unnecessary introduction in the response.\n\n"
+            + "\n\n".join(summaries)
+        )
+
+    def request_token_budget(self):
+        """
+        Estimated prompt tokens of a chunk or packed request: the model's context
+        window minus the room left for the response.
+        """
+        return self.estimator.context_window - CHUNK_RESPONSE_TOKENS
+
+    def key_sentence_token_budget(self):
+        """Largest key-sentence section, in estimated tokens, whose summary request fits the window."""
+        return self.request_token_budget() - self.estimator.count(self.build_prompt([]))
+
+    def chunk_token_budget(self):
+        """
+        Chunk size, in estimated tokens, whose key sentences fill one summary request.
+
+        Only `key_sentence_ratio` of a chunk's words is sent to the LLM, so the chunk
+        is that much larger than the key-sentence budget.
+        """
+        return int(self.key_sentence_token_budget() / self.key_sentence_ratio)
+
+    def fit_key_sentences(self, key_sentences, token_budget):
+        """
+        Best-ranked prefix of `key_sentences` (in score order) whose estimated tokens fit
+        `token_budget`, keeping at least one sentence. The selection covers a share of
+        the chunk's words, so sentences heavier in tokens than average can overshoot.
+        """
+        total = 0
+        for index, sentence in enumerate(key_sentences):
+            total += self.estimator.count(sentence)
+            if total > token_budget and index:
+                return key_sentences[:index]
+        return key_sentences
+
+    def reduce_token_budget(self, is_final_summary=False):
+        """
+        Estimated tokens of summaries that fit one reduce request (or the final
+        summary request) together with its template and response.
+        """
+        if is_final_summary:
+            template_tokens = self.estimator.count(self.build_prompt([], is_final_summary=True))
+            return self.estimator.context_window - template_tokens - FINAL_RESPONSE_TOKENS
+        template_tokens = self.estimator.count(self.build_reduce_prompt([]))
+        return self.estimator.context_window - template_tokens - CHUNK_RESPONSE_TOKENS
+
+    def call_llm(self, sentences, is_final_summary=False):
+        """
+        Call the Groq LLM to generate a summary based on the key sentences.
+        """
+        prompt = self.build_prompt(sentences, is_final_summary)
         print(f"Sending to Groq LLM: {prompt}")
         try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                model="llama3-8b-8192",
-            )
-            summary = chat_completion.choices[0].message.content.strip()
+            summary = self.llm.complete(prompt)
             print(f"Generated summary: {summary}")
             return summary
         except Exception as e:
             print(f"Error calling Groq LLM: {e}")
             return ""
     
-    def summarize_document(self, chunks,pdf_path):
+    def call_llm_packed(self, pack):
+        """
+        Ask for the themes of several sections in a single request.
+
+        :param pack: List of key-sentence lists, one per section
+        :return: List of per-section summaries, or None if the call failed or the
+                 response could not be split into sections
+        """
+        prompt = build_packed_prompt(pack)
+        print(f"Sending {len(pack)} packed sections to the LLM: {prompt}")
+        try:
+            response = self.llm.complete(prompt)
+        except Exception as e:
+            print(f"Error calling Groq LLM: {e}")
+            return None
+        summaries = parse_packed_response(response, len(pack))
+        if summaries is None:
+            print("Packed response could not be parsed, summarizing the sections one by one.")
+        return summaries
+
+    def call_llm_combined(self, sentences, keywords, is_final_summary=False):
+        """
+        Ask for the summary and the refined keywords in a single request.
+
+        :param keywords: Initially extracted keywords to refine
+        :return: (summary, refined keywords text); the summary is None if the call
+                 failed or the response had no summary block, the keywords are None
+                 if it had no keywords block
+        """
+        prompt = build_combined_prompt(self.build_prompt(sentences, is_final_summary), keywords)
+        print(f"Sending combined summary and keyword request to the LLM: {prompt}")
+        try:
+            response = self.llm.complete(prompt)
+        except Exception as e:
+            print(f"Error calling Groq LLM: {e}")
+            return None, None
+        summary, refined_keywords = parse_combined_response(response)
+        if summary is None:
+            print("Combined response could not be parsed, requesting the summary on its own.")
+        elif refined_keywords is None:
+            print("Combined response has no keywords block, keywords will be refined separately.")
+        return summary, refined_keywords
+
+    def keyword_final_stage(self, keywords):
+        """
+        Final request function that also refines `keywords`, returning (summary,
+        refined keywords text or None). Falls back to the plain summary request when
+        the combined response has no summary block.
+        """
+        def final_stage(sentences, is_final_summary=False):
+            summary, refined_keywords = self.call_llm_combined(sentences, keywords, is_final_summary)
+            if summary is None:
+                summary = self.call_llm(sentences, is_final_summary)
+            return summary, refined_keywords
+        return final_stage
+
+    def iter_key_sentences(self, chunks, tokens=None):
+        """
+        Key sentences of every chunk. `tokens` is the DocumentTokens of the document
+        the chunks slice; it is built here when the caller has none.
+        """
+        if not chunks:
+            return
+        if tokens is None:
+            tokens = DocumentTokens(chunks[0].source)
+        # One TF-IDF fit over the sentences of all chunks, then a cheap selection per chunk
+        scored_chunks = self.scorer.score_document(tokens, [(chunk.start, chunk.end) for chunk in chunks])
+        section_budget = self.key_sentence_token_budget()
+        for i, (chunk, scored) in enumerate(zip(chunks, scored_chunks)):
+            print(f"\nSummarizing chunk {i+1}/{len(chunks)} (pages {chunk.page_start}-{chunk.page_end}, {chunk.word_count} words):")
+            key_sentences = self.fit_key_sentences(
+                self.select_key_sentences(scored, self.key_sentence_ratio), section_budget
+            )
+            if key_sentences:
+                yield key_sentences
+
+    async def summarize_chunks_async(self, chunks, tokens=None):
+        """
+        Summarize the chunks concurrently, keeping at most `max_concurrency` LLM calls in
+        flight. Key sentences are extracted on the event loop while earlier requests are
+        pending and the summaries are returned in chunk order.
+
+        Key sentences of consecutive chunks are packed into shared requests up to
+        `pack_token_budget` tokens; a pack whose response cannot be parsed falls back
+        to one request per chunk.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            async def run(func, *args):
+                async with semaphore:
+                    return await loop.run_in_executor(executor, func, *args)
+
+            async def summarize_pack(pack):
+                if len(pack) > 1:
+                    summaries = await run(self.call_llm_packed, pack)
+                    if summaries is not None:
+                        return summaries
+                return await asyncio.gather(*(run(self.call_llm, key_sentences) for key_sentences in pack))
+
+            sections = self.iter_key_sentences(chunks, tokens)
+            if self.pack_token_budget > 0:
+                packs = pack_sections(sections, self.pack_token_budget, self.pack_max_sections,
+                                      count_tokens=self.estimator.count)
+            else:
+                packs = ([key_sentences] for key_sentences in sections)
+
+            tasks = []
+            for pack in packs:
+                tasks.append(asyncio.ensure_future(summarize_pack(pack)))
+                # Let the request start before extracting the next chunk's key sentences.
+                await asyncio.sleep(0)
+            results = await asyncio.gather(*tasks)
+
+        return [summary for pack_summaries in results for summary in pack_summaries]
+
+    def summarize_chunks(self, chunks, tokens=None):
+        """Synchronous wrapper around summarize_chunks_async."""
+        return asyncio.run(self.summarize_chunks_async(chunks, tokens))
+
+    def call_llm_reduce(self, summaries):
+        """Merge a group of consecutive summaries into one; returns "" on error."""
+        prompt = self.build_reduce_prompt(summaries)
+        print(f"Merging {len(summaries)} summaries with the LLM.")
+        try:
+            return self.llm.complete(prompt)
+        except Exception as e:
+            print(f"Error calling Groq LLM: {e}")
+            return ""
+
+    def group_summaries(self, summaries, token_budget):
+        """
+        Split consecutive summaries into groups whose joined text fits `token_budget`
+        estimated tokens. Every group holds at least two summaries (except possibly
+        the last), so each reduce level at least halves the number of summaries.
+        """
+        groups = []
+        group = []
+        group_tokens = 0
+        for summary in summaries:
+            tokens = self.estimator.count(summary)
+            if len(group) >= 2 and group_tokens + tokens > token_budget:
+                groups.append(group)
+                group = []
+                group_tokens = 0
+            group.append(summary)
+            group_tokens += tokens
+        if group:
+            groups.append(group)
+        return groups
+
+    async def reduce_summaries_async(self, summaries, final_stage=None, final_overhead=0):
+        """
+        Reduce chunk summaries to one final summary with a map-reduce tree.
+
+        While the summaries do not fit a single final-summary request, they are
+        merged in groups that fit one request, all groups of a level running
+        concurrently. The number of levels, and so the latency, grows with the
+        logarithm of the number of chunks. A group whose merge fails is carried to
+        the next level as its concatenated input.
+
+        `final_stage` makes the last request instead of call_llm, with
+        `final_overhead` extra prompt and response tokens to leave room for.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        final_budget = self.reduce_token_budget(is_final_summary=True) - final_overhead
+        group_budget = self.reduce_token_budget()
+        summaries = [summary for summary in summaries if summary]
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            async def run(func, *args):
+                async with semaphore:
+                    return await loop.run_in_executor(executor, func, *args)
+
+            level = 0
+            while len(summaries) > 1 and self.estimator.count(" ".join(summaries)) > final_budget:
+                groups = self.group_summaries(summaries, group_budget)
+                level += 1
+                print(f"Reduce level {level}: merging {len(summaries)} summaries in {len(groups)} groups.")
+                merged = await asyncio.gather(*(run(self.call_llm_reduce, group) for group in groups))
+                summaries = [summary or " ".join(group) for summary, group in zip(merged, groups)]
+
+            final_concatenated_summary = " ".join(summaries)
+            print("\nConcatenated summary of all chunks:\n", final_concatenated_summary)
+            return await run(final_stage or self.call_llm, [final_concatenated_summary], True)
+
+    def reduce_summaries(self, summaries, final_stage=None, final_overhead=0):
+        """Synchronous wrapper around reduce_summaries_async."""
+        return asyncio.run(self.reduce_summaries_async(summaries, final_stage, final_overhead))
+
+    def summarize_extractive(self, chunks, tokens=None, ratio=None):
+        """
+        Build a summary from the TF-IDF key sentences alone, without any LLM call.
+
+        The top-scoring sentences of every chunk, covering `ratio` of its words, are
+        kept in document order; sentences repeated by the chunk overlap appear once.
+        """
+        if ratio is None:
+            ratio = float(os.environ.get("EXTRACTIVE_SUMMARY_RATIO", EXTRACTIVE_SUMMARY_RATIO))
+        if not chunks:
+            return ""
+        if tokens is None:
+            tokens = DocumentTokens(chunks[0].source)
+        scored_chunks = self.scorer.score_document(tokens, [(chunk.start, chunk.end) for chunk in chunks])
+        summary_sentences = []
+        seen = set()
+        for scored in scored_chunks:
+            selected, _, _ = select_top_sentences(scored, ratio, document_order=True)
+            for sentence in selected:
+                if sentence not in seen:
+                    seen.add(sentence)
+                    summary_sentences.append(sentence)
+        return " ".join(summary_sentences)
+
+    def summarize_document(self, chunks, document, tokens=None):
         """
         Summarize the document. If the document has fewer than 3 pages, send the entire text
         to the LLM. Otherwise, process and summarize each paragraph.
+
+        `chunks` are the Chunk records returned by merge_short_paragraphs_with_overlap.
+
+        `document` is either the PDF path or the DocumentHandle already opened by the
+        caller, in which case its cached page count is reused instead of re-parsing.
+
+        `tokens` is the DocumentTokens of the document text, shared with the keyword
+        extractor so the text is tokenized only once.
+        """
+        return self._summarize_document(chunks, document, tokens, self.call_llm)
+
+    def summarize_document_with_keywords(self, chunks, document, keywords, tokens=None):
         """
-     
-        pdf_reader = PdfReader(pdf_path)
-        num_pages = len(pdf_reader.pages)
-#
+        Summarize the document like summarize_document, with the final request also
+        refining the initially extracted `keywords`. This saves the separate keyword
+        refinement request and its second copy of the summary.
+
+        :return: (summary, refined keywords text), the keywords being None when the
+                 response did not contain them and they have to be refined separately
+        """
+        final_stage = self.keyword_final_stage(keywords)
+        final_overhead = (self.estimator.count(build_combined_prompt("", keywords))
+                          + KEYWORDS_RESPONSE_TOKENS)
+        return self._summarize_document(chunks, document, tokens, final_stage, final_overhead)
+
+    def _summarize_document(self, chunks, document, tokens, final_stage, final_overhead=0):
+        num_pages = as_document_handle(document).num_pages
         
         if num_pages < 3:
             # If the document has less than 3 pages, send the entire text to the LLM
-            entire_text = " ".join(chunks)
+            entire_text = " ".join(str(chunk) for chunk in chunks)
             print(f"Document has {num_pages} pages. Sending the entire text to the LLM.")
-            return self.call_llm([entire_text])
+            return final_stage([entire_text])
         else:
             # Otherwise, process the document in chunks and summarize each chunk
-            all_summaries = []
-
-            for i, chunk in enumerate(chunks):
-                print(f"\nSummarizing chunk {i+1}/{len(chunks)}:")
-                key_sentences = self.extract_key_sentences(chunk)
-                if key_sentences:
-                    summary = self.call_llm(key_sentences)
-                    all_summaries.append(summary)
-            
-            
-            final_concatenated_summary = " ".join(all_summaries)
-            print("\nConcatenated summary of all chunks:\n", final_concatenated_summary)
-            
-           
-            final_summary = self.call_llm([final_concatenated_summary], is_final_summary=True)
+            all_summaries = self.summarize_chunks(chunks, tokens)
+
+            # Merge the chunk summaries level by level until they fit one final request
+            final_summary = self.reduce_summaries(all_summaries, final_stage, final_overhead)
             print(final_summary)
             
             return final_summary
 
-
 if __name__ == "__main__":
     summarizer = DynamicSummarizer()
 
     pdf_path =  "C:\\Users\\kisha\\Desktop\\pdf_folder\\Operating System Notes.pdf"
-    paragraphs = extract_paragraphs_with_boundaries(pdf_path)
-    chunks = merge_short_paragraphs_with_overlap(paragraphs)
+    document = DocumentHandle(pdf_path)
+    paragraphs = extract_paragraphs_with_boundaries(document)
+    chunks = merge_short_paragraphs_with_overlap(
+        paragraphs, text=document.text(), max_tokens=summarizer.chunk_token_budget(), estimator=summarizer.estimator,
+        page_offsets=document.page_offsets
+    )
     
-    summary = summarizer.summarize_document(chunks,pdf_path)
+    summary = summarizer.summarize_document(chunks, document)
     print("\nFinal Summary:\n", summary)
 
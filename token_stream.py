@@ -0,0 +1,132 @@
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from nltk.tokenize import sent_tokenize, word_tokenize
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from lemmatizer import count_lemmas
+
+# Index terms are runs of two or more word characters, as in TfidfVectorizer's default
+# token pattern, so "real-time" yields "real" and "time"; stop words are left out
+TERM = re.compile(r'\w\w+')
+
+# Values of DocumentTokens._term_flags: the word has no index term, is itself the only
+# one, or is split into several (see word_terms)
+NO_TERMS, WHOLE_WORD, SPLIT_WORD = 0, 1, 2
+
+# Quote tokens that word_tokenize rewrites and the character they stand for in the text
+_QUOTE_TOKENS = {'``': '"', "''": '"'}
+
+
+def word_terms(token):
+    """Index terms within one word token, in order."""
+    return [term for term in TERM.findall(token) if term not in ENGLISH_STOP_WORDS]
+
+
+def term_flag(token):
+    terms = word_terms(token)
+    if not terms:
+        return NO_TERMS
+    if len(terms) == 1 and terms[0] == token:
+        return WHOLE_WORD
+    return SPLIT_WORD
+
+
+class DocumentTokens:
+    """
+    Sentence and word tokenization of one document, computed once and shared by the
+    summarizer and the keyword extractor.
+
+    Sentences come from sent_tokenize and words from word_tokenize applied to each
+    sentence, both located in the text as character spans. Words are stored once in
+    lowercase; index terms and lemmas are derived from them lazily.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.sentence_starts = array('q')
+        self.sentence_ends = array('q')
+        # sentence_bounds[i] is the index of the first word after sentence i
+        self.sentence_bounds = array('q')
+        self.word_starts = array('q')
+        self.words = []
+        self._term_flags = None
+        self._lemma_counts = None
+
+        position = 0
+        for sentence in sent_tokenize(text):
+            start = text.find(sentence, position)
+            if start < 0:
+                start = position
+            end = start + len(sentence)
+            word_position = start
+            for token in word_tokenize(sentence, preserve_line=True):
+                word_start = text.find(token, word_position, end)
+                if word_start < 0 and token in _QUOTE_TOKENS:
+                    word_start = text.find(_QUOTE_TOKENS[token], word_position, end)
+                if word_start < 0:
+                    word_start = word_position
+                else:
+                    word_position = word_start + len(token)
+                self.word_starts.append(word_start)
+                self.words.append(token.lower())
+            self.sentence_starts.append(start)
+            self.sentence_ends.append(end)
+            self.sentence_bounds.append(len(self.words))
+            position = end
+
+    def __len__(self):
+        return len(self.words)
+
+    @property
+    def num_sentences(self):
+        return len(self.sentence_bounds)
+
+    def sentence_words(self, index):
+        """Word index range (first_word, last_word) of sentence `index`."""
+        return self.sentence_bounds[index - 1] if index else 0, self.sentence_bounds[index]
+
+    def span_sentences(self, start, end):
+        """
+        Sentences overlapping the character span [start, end), clipped to it.
+
+        :return: Generator of (sentence_index, sentence_text, first_word, last_word)
+                 tuples where the clipped sentence's words are ``words[first_word:last_word]``
+        """
+        index = bisect_right(self.sentence_ends, start)
+        while index < len(self.sentence_starts) and self.sentence_starts[index] < end:
+            sentence_start = max(self.sentence_starts[index], start)
+            sentence_end = min(self.sentence_ends[index], end)
+            lo, hi = self.sentence_words(index)
+            first_word = bisect_left(self.word_starts, sentence_start, lo, hi)
+            last_word = bisect_left(self.word_starts, sentence_end, first_word, hi)
+            if last_word > first_word:
+                yield index, self.text[sentence_start:sentence_end].strip(), first_word, last_word
+            index += 1
+
+    def terms(self, first_word=0, last_word=None):
+        """Index terms (see word_terms) of ``words[first_word:last_word]``, in order."""
+        return list(self.iter_terms(first_word, last_word))
+
+    def iter_terms(self, first_word=0, last_word=None):
+        """Like terms, as a generator, for consumers that stream the terms."""
+        if self._term_flags is None:
+            self._term_flags = bytearray(term_flag(word) for word in self.words)
+        if last_word is None:
+            last_word = len(self.words)
+        flags = self._term_flags
+        words = self.words
+        for i in range(first_word, last_word):
+            flag = flags[i]
+            if flag == WHOLE_WORD:
+                yield words[i]
+            elif flag == SPLIT_WORD:
+                yield from word_terms(words[i])
+
+    def lemma_counts(self, stop_words, lemmatize):
+        """
+        Counter of the lemmas of the alphabetic words that are not in `stop_words`
+        (see count_lemmas), computed on first use.
+        """
+        if self._lemma_counts is None:
+            self._lemma_counts = count_lemmas(self.words, stop_words, lemmatize)
+        return self._lemma_counts
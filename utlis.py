@@ -1,105 +1,247 @@
-from PyPDF2 import PdfReader
+import hashlib
+import math
+import os
 import re
+from array import array
+from bisect import bisect_right
+from document_handle import PAGE_SEPARATOR, as_document_handle
+from records import Chunk, Paragraph
+from token_estimator import TokenEstimator
+
+WORD = re.compile(r'\S+')
+# In token mode a chunk ends at a paragraph break rather than mid-paragraph when it is
+# at least this full
+MIN_CHUNK_FILL = 0.8
+
+def iter_paragraphs(pages, max_words=1500):
+    """
+    Stream Paragraph records of at most `max_words` words (unlimited when None) from
+    an iterable of pages.
+
+    Paragraphs are separated by blank lines, i.e. by whitespace between two words that
+    holds at least two newlines, so breaks are found from the newlines counted between
+    consecutive words and a break running across a page boundary is still seen. Only
+    the current page is scanned and paragraphs are bare offset records, so memory does
+    not grow with the length of a paragraph even when the text has no blank lines at
+    all. The offsets index into the document text (see DocumentHandle.text), and the
+    paragraph text is ``text[paragraph.start:paragraph.end]``.
+    """
+    page_offsets = array('q')
+    paragraph_index = 0
+    start = end = None
+    word_count = 0
+    # Newlines in the whitespace since the last word
+    newlines = 0
+
+    def make_paragraph():
+        return Paragraph(
+            paragraph_index, start, end,
+            bisect_right(page_offsets, start), bisect_right(page_offsets, end - 1),
+            word_count
+        )
+
+    for page in pages:
+        page_offsets.append(page.offset)
+        segment = page.text + PAGE_SEPARATOR
+        position = 0
+        for match in WORD.finditer(segment):
+            newlines += segment.count('\n', position, match.start())
+            position = match.end()
+            if word_count and (newlines >= 2 or word_count == max_words):
+                paragraph_index += 1
+                yield make_paragraph()
+                word_count = 0
+            if word_count == 0:
+                start = page.offset + match.start()
+            end = page.offset + match.end()
+            word_count += 1
+            newlines = 0
+        newlines += segment.count('\n', position)
+
+    if word_count:
+        paragraph_index += 1
+        yield make_paragraph()
 
 def extract_paragraphs_with_boundaries(pdf_path, max_words=1500):
-    reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text()
-    
-    raw_paragraphs = re.split(r'\n\s*\n', text.strip())
-    paragraph_info = []
-    current_position = 0
-    current_paragraph = ""
-    
-    for raw_paragraph in raw_paragraphs:
-        words = raw_paragraph.split()
-        for word in words:
-            if len(current_paragraph.split()) < max_words:
-                if current_paragraph:
-                    current_paragraph += " " + word
-                else:
-                    current_paragraph = word
-            else:
-                paragraph_start = current_position
-                paragraph_end = current_position + len(current_paragraph)
-                paragraph_info.append({
-                    'paragraph_index': len(paragraph_info) + 1,
-                    'paragraph_start': paragraph_start,
-                    'paragraph_end': paragraph_end,
-                    'paragraph_text': current_paragraph
-                })
-                current_position = paragraph_end + 1
-                current_paragraph = word
-        
-        
-        if current_paragraph:
-            paragraph_start = current_position
-            paragraph_end = current_position + len(current_paragraph)
-            paragraph_info.append({
-                'paragraph_index': len(paragraph_info) + 1,
-                'paragraph_start': paragraph_start,
-                'paragraph_end': paragraph_end,
-                'paragraph_text': current_paragraph
-            })
-            current_position = paragraph_end + 2
-            current_paragraph = ""
-    
-    return paragraph_info
-
-def merge_short_paragraphs_with_overlap(paragraphs, word_threshold=500, max_words=4000, overlap_percentage=0.1):
+    document = as_document_handle(pdf_path)
+    if document.is_encrypted:
+        return []
+    return list(iter_paragraphs(document.iter_pages(), max_words))
+
+def build_word_offsets(paragraphs, text, estimator=None):
+    """
+    Tokenize the paragraphs once into flat word-offset arrays.
+
+    :param paragraphs: Paragraph records with offsets into the document text
+    :param text: The document text
+    :param estimator: Optional TokenEstimator; when given, cumulative token estimates
+                      are computed in the same pass
+    :return: Tuple of (word start offsets, word end offsets, paragraph word bounds, token
+             prefix sums) where ``paragraph_bounds[i]`` is the index of the first word
+             after paragraph i and ``token_prefix[i]`` the estimated tokens of the first
+             i words (None without an estimator)
+    """
+    word_starts = array('q')
+    word_ends = array('q')
+    paragraph_bounds = array('q')
+    token_prefix = None
+    if estimator is not None:
+        token_prefix = array('d', [0.0])
+        count_word = estimator.count_word
+    total_tokens = 0.0
+    for paragraph in paragraphs:
+        for match in WORD.finditer(text, paragraph.start, paragraph.end):
+            word_starts.append(match.start())
+            word_ends.append(match.end())
+            if token_prefix is not None:
+                total_tokens += count_word(match.group())
+                token_prefix.append(total_tokens)
+        paragraph_bounds.append(len(word_starts))
+    return word_starts, word_ends, paragraph_bounds, token_prefix
+
+def merge_short_paragraphs_with_overlap(paragraphs, word_threshold=500, max_words=4000, overlap_percentage=0.1, text=None,
+                                       max_tokens=None, estimator=None, page_offsets=None):
+    """
+    Merge short paragraphs and split long runs into overlapping chunks.
+
+    Paragraphs under `word_threshold` words are accumulated until a longer paragraph
+    closes the run. Every run is cut into pieces of at most `max_words` words and each
+    piece is prefixed with the last `overlap_percentage` of the previous chunk's words.
+
+    When `max_tokens` is given, paragraph lengths no longer decide the chunks:
+    consecutive paragraphs are packed greedily into chunks of up to `max_tokens`
+    estimated tokens including the overlap. A chunk ends at the last paragraph break
+    that fits when that leaves it at least MIN_CHUNK_FILL full, and otherwise mid
+    paragraph at the budget. All sizes are measured on a precomputed word-offset
+    array, and the chunks are returned as Chunk slices of the document text.
+
+    :param paragraphs: List of Paragraph records as produced by iter_paragraphs
+    :param text: Document text the paragraph offsets refer to (required)
+    :param max_tokens: Token budget per chunk; replaces `max_words` when given
+    :param estimator: TokenEstimator used for the token budget
+    :param page_offsets: Offset of every page in `text` (see DocumentHandle.page_offsets);
+                         chunk pages are those of their first and last word. Without
+                         it they are approximated by the pages of the enclosing paragraphs
+    :return: List of Chunk records
+    """
+    if text is None:
+        raise ValueError("merge_short_paragraphs_with_overlap needs the document text")
+    if max_tokens is not None and estimator is None:
+        estimator = TokenEstimator.for_model(None)
+    word_starts, word_ends, paragraph_bounds, token_prefix = build_word_offsets(
+        paragraphs, text, estimator if max_tokens is not None else None
+    )
     merged_paragraphs = []
-    temp_paragraph = ""
-    
-    for i, para_info in enumerate(paragraphs):
-        paragraph = para_info['paragraph_text']
-        word_count = len(paragraph.split())
-        
-        if word_count < word_threshold:
-            if temp_paragraph:
-                temp_paragraph += " " + paragraph
+
+    def chunk_pages(chunk_first, piece_end):
+        if page_offsets is None:
+            return (paragraphs[bisect_right(paragraph_bounds, chunk_first)].page_start,
+                    paragraphs[bisect_right(paragraph_bounds, piece_end - 1)].page_end)
+        return (bisect_right(page_offsets, word_starts[chunk_first]),
+                bisect_right(page_offsets, word_ends[piece_end - 1] - 1))
+
+    def fitting_end(chunk_first, first_word, last_word):
+        # Last word index such that words [chunk_first, end) stay within the token budget
+        limit = token_prefix[chunk_first] + max_tokens
+        return bisect_right(token_prefix, limit, first_word + 1, last_word + 1) - 1
+
+    def emit(first_word, last_word):
+        while first_word < last_word:
+            overlap_words = 0
+            if merged_paragraphs:
+                overlap_words = min(int(merged_paragraphs[-1].word_count * overlap_percentage), first_word)
+            chunk_first = first_word - overlap_words
+            token_count = None
+            if token_prefix is None:
+                piece_end = min(first_word + max_words, last_word)
             else:
-                temp_paragraph = paragraph
+                piece_end = fitting_end(chunk_first, first_word, last_word)
+                if piece_end < last_word:
+                    # Last paragraph break within the piece
+                    index = bisect_right(paragraph_bounds, piece_end) - 1
+                    boundary = paragraph_bounds[index] if index >= 0 else 0
+                    if (boundary > first_word and
+                            token_prefix[boundary] - token_prefix[chunk_first] >= MIN_CHUNK_FILL * max_tokens):
+                        piece_end = boundary
+                if piece_end <= first_word:
+                    # The overlap leaves no room for new words: drop it, and if a single
+                    # word still exceeds the budget emit it on its own.
+                    chunk_first = first_word
+                    piece_end = max(fitting_end(chunk_first, first_word, last_word), first_word + 1)
+                token_count = math.ceil(token_prefix[piece_end] - token_prefix[chunk_first])
+            merged_paragraphs.append(Chunk(
+                len(merged_paragraphs) + 1, text,
+                word_starts[chunk_first], word_ends[piece_end - 1],
+                *chunk_pages(chunk_first, piece_end),
+                piece_end - chunk_first,
+                token_count
+            ))
+            first_word = piece_end
+
+    if token_prefix is not None:
+        emit(0, len(word_starts))
+        return merged_paragraphs
+
+    pending_start = None
+    word_position = 0
+    for paragraph_end in paragraph_bounds:
+        if paragraph_end - word_position < word_threshold:
+            if pending_start is None:
+                pending_start = word_position
         else:
-            if temp_paragraph:
-                merged_paragraph = temp_paragraph + " " + paragraph
-            else:
-                merged_paragraph = paragraph
-            
-            # Split if the merged paragraph exceeds max_words
-            while len(merged_paragraph.split()) > max_words:
-                split_point = max_words
-                while split_point > 0 and merged_paragraph[split_point] != ' ':
-                    split_point -= 1
-                
-                if merged_paragraphs:
-                    prev_paragraph = merged_paragraphs[-1]
-                    overlap_words = int(len(prev_paragraph.split()) * overlap_percentage)
-                    current_chunk = " ".join(prev_paragraph.split()[-overlap_words:]) + " " + merged_paragraph[:split_point]
-                else:
-                    current_chunk = merged_paragraph[:split_point]
-                
-                merged_paragraphs.append(current_chunk)
-                merged_paragraph = merged_paragraph[split_point:].strip()
-            
-            if merged_paragraph:
-                if merged_paragraphs:
-                    prev_paragraph = merged_paragraphs[-1]
-                    overlap_words = int(len(prev_paragraph.split()) * overlap_percentage)
-                    merged_paragraph = " ".join(prev_paragraph.split()[-overlap_words:]) + " " + merged_paragraph
-                merged_paragraphs.append(merged_paragraph)
-            
-            temp_paragraph = ""
-    
-    if temp_paragraph:
-        if merged_paragraphs:
-            prev_paragraph = merged_paragraphs[-1]
-            overlap_words = int(len(prev_paragraph.split()) * overlap_percentage)
-            temp_paragraph = " ".join(prev_paragraph.split()[-overlap_words:]) + " " + temp_paragraph
-        merged_paragraphs.append(temp_paragraph)
-    
+            emit(word_position if pending_start is None else pending_start, paragraph_end)
+            pending_start = None
+        word_position = paragraph_end
+
+    if pending_start is not None:
+        emit(pending_start, word_position)
+
     return merged_paragraphs
 
+def file_sha256(file_path, block_size=1 << 20):
+    """Return the hex SHA-256 digest of a file's content, read in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_cache_dir(name):
+    """
+    Return (and create) a named directory under the pipeline cache root.
+
+    The root defaults to ~/.cache/pdf_pipeline and can be moved with PDF_PIPELINE_CACHE_DIR.
+    """
+    root = os.path.expanduser(os.environ.get("PDF_PIPELINE_CACHE_DIR", "~/.cache/pdf_pipeline"))
+    path = os.path.join(root, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+NLTK_RESOURCES = {
+    'punkt': 'tokenizers/punkt',
+    'stopwords': 'corpora/stopwords',
+    'wordnet': 'corpora/wordnet',
+}
+_nltk_ready = False
+
+def ensure_nltk_data():
+    """
+    Make sure the NLTK data used by the pipeline is installed.
+
+    Resources already on disk are found locally and only missing ones are downloaded,
+    and the check runs once per process.
+    """
+    global _nltk_ready
+    if _nltk_ready:
+        return
+    import nltk
+    for package, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            nltk.download(package, quiet=True)
+    _nltk_ready = True
+
 def classify_document_length(num_pages):
     try:
         num_pages = int(num_pages)